@@ -23,13 +23,19 @@
 """
 
 import asyncio
+import base64
+import hashlib
 import json
-from typing import Optional, Dict, List, Any
+import logging
+import random
+import time
+from typing import Optional, Dict, List, Any, AsyncIterator, BinaryIO, Callable, Tuple
 from pathlib import Path
 import httpx
+import openai
 from openai import AsyncOpenAI
-from openai.types.chat import ChatCompletion
-from openai.types import ImagesResponse
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types import Image, ImagesResponse
 
 from core.logger import get_logger, log_api_request, log_api_response, log_exception
 from core.exceptions import (
@@ -44,6 +50,49 @@ from core.exceptions import (
 
 logger = get_logger(__name__)
 
+# Повторные попытки chat completion (экспоненциальная задержка с jitter)
+_RETRY_ATTEMPTS = 3
+_RETRY_BASE_DELAY = 1.0
+_RETRY_MAX_DELAY = 30.0
+_RETRY_JITTER = 0.5
+
+# Одинаковые одновременные запросы объединяются только для почти
+# детерминированных запросов (модерация, переформулировка)
+_DEDUP_MAX_TEMPERATURE = 0.3
+
+# Размер чанка при потоковом скачивании изображений
+_DOWNLOAD_CHUNK_SIZE = 65536
+
+# Сколько секунд считать успешную проверку подключения актуальной
+_VALIDATION_TTL = 300.0
+
+# Поле refusal есть не во всех версиях SDK - проверяем один раз при импорте,
+# а не через hasattr на каждом ответе
+_MESSAGE_HAS_REFUSAL = "refusal" in ChatCompletionMessage.model_fields
+
+# Префиксы моделей нового API (GPT-5, O1, O3):
+# max_completion_tokens вместо max_tokens и фиксированный temperature.
+# Кортеж позволяет проверить все префиксы одним вызовом str.startswith
+_REASONING_MODEL_PREFIXES = (
+    'gpt-5',
+    'o1-preview',
+    'o1-mini',
+    'o3-mini',
+    'o3',
+)
+
+
+def _open_for_write(path: Path) -> BinaryIO:
+    """Создать папку и открыть файл на запись (один переход в поток вместо двух)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    return open(path, "wb")
+
+
+def _write_file(path: Path, data: bytes) -> None:
+    """Создать папку и записать файл целиком (выполняется в отдельном потоке)"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+
 
 class ProxyAPIClient:
     """
@@ -73,7 +122,11 @@ class ProxyAPIClient:
         api_key: str,
         base_url: str = "https://api.proxyapi.ru/openai/v1",
         timeout: int = 60,
-        max_retries: int = 3
+        max_retries: int = 3,
+        max_concurrent_requests: int = 8,
+        max_concurrent_images: int = 2,
+        max_concurrent_transcriptions: int = 4,
+        max_concurrent_streams: int = 8
     ):
         """
         Инициализация клиента
@@ -82,19 +135,79 @@ class ProxyAPIClient:
             api_key: API ключ от ProxyAPI.ru
             base_url: Базовый URL API
             timeout: Таймаут запросов в секундах
-            max_retries: Максимальное количество повторных попыток
+            max_retries: Максимальное количество повторных попыток SDK (кроме chat_completion,
+                у которого свои повторы - см. _chat_completion_with_retry)
+            max_concurrent_requests: Максимум одновременных запросов chat completion
+            max_concurrent_images: Максимум одновременных запросов генерации изображений
+            max_concurrent_transcriptions: Максимум одновременных запросов транскрибации
+            max_concurrent_streams: Максимум одновременных потоковых chat completion
         """
         self.api_key = api_key
         self.base_url = base_url
         self.timeout = timeout
         self.max_retries = max_retries
         
+        # HTTP транспорт для OpenAI клиента (чат, изображения, транскрибация): HTTP/2
+        # мультиплексирует параллельные запросы в одном TCP+TLS соединении, пул держит
+        # соединения открытыми минуту - редкие запросы (голосовые) не платят за handshake
+        self._http_client = httpx.AsyncClient(
+            http2=True,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=1000,
+                max_keepalive_connections=100,
+                keepalive_expiry=60
+            )
+        )
+        
         # Инициализация OpenAI клиента с настройками для ProxyAPI
         self.client = AsyncOpenAI(
             api_key=api_key,
             base_url=base_url,
             timeout=timeout,
-            max_retries=max_retries
+            max_retries=max_retries,
+            http_client=self._http_client
+        )
+        
+        # Для chat_completion повторы выполняет _chat_completion_with_retry (с jitter и
+        # retry_after), поэтому встроенные повторы SDK для него отключены: иначе каждая
+        # попытка обертки сама превращалась бы в несколько HTTP запросов.
+        # Копия клиента использует тот же HTTP транспорт
+        self._chat_client = self.client.with_options(max_retries=0)
+        
+        # Ограничение числа одновременных запросов, чтобы не упираться в rate limit
+        # провайдера (DALL-E ограничен строже, поэтому отдельный семафор).
+        # Whisper не принимает несколько файлов за один запрос: при всплеске голосовых
+        # запросы идут параллельно по общему HTTP/2 соединению, но не больше лимита
+        self._chat_semaphore = asyncio.Semaphore(max_concurrent_requests)
+        self._image_semaphore = asyncio.Semaphore(max_concurrent_images)
+        self._transcription_semaphore = asyncio.Semaphore(max_concurrent_transcriptions)
+        # Поток держит слот, пока вызывающий читает ответ (с паузами на правки сообщений
+        # в Telegram), поэтому у потоков свой семафор: короткие запросы (модерация,
+        # переформулировка, эмбеддинги) не ждут за ними в очереди
+        self._stream_semaphore = asyncio.Semaphore(max_concurrent_streams)
+        
+        # Выполняющиеся запросы chat completion: ключ запроса -> задача
+        self._inflight: Dict[str, asyncio.Future] = {}
+        
+        # Построители параметров chat completion по моделям (см. _get_param_builder)
+        self._param_builders: Dict[str, Callable[..., Dict[str, Any]]] = {}
+        
+        # Время (time.monotonic) последней успешной проверки подключения
+        self._validated_at: Optional[float] = None
+        
+        # Общий HTTP клиент для скачивания изображений (keep-alive, пул соединений)
+        # Переиспользование соединений убирает TCP+TLS handshake на каждое скачивание,
+        # а HTTP/2 пускает одновременные скачивания с хранилища по одному соединению.
+        # Изображения генерируются реже чата, поэтому соединение держится минуту, как у API
+        self._download_client = httpx.AsyncClient(
+            http2=True,
+            timeout=30,
+            limits=httpx.Limits(
+                max_connections=1000,
+                max_keepalive_connections=100,
+                keepalive_expiry=60
+            )
         )
         
         logger.info(f"ProxyAPI клиент инициализирован | Base URL: {base_url}")
@@ -113,23 +226,7 @@ class ProxyAPIClient:
         Returns:
             True если модель использует max_completion_tokens
         """
-        model_lower = model.lower()
-        
-        # Модели, которые используют max_completion_tokens
-        new_models = [
-            'gpt-5',
-            'o1-preview',
-            'o1-mini',
-            'o3-mini',
-            'o3',
-        ]
-        
-        # Проверяем начинается ли модель с одного из новых префиксов
-        for new_model in new_models:
-            if model_lower.startswith(new_model):
-                return True
-        
-        return False
+        return model.lower().startswith(_REASONING_MODEL_PREFIXES)
     
     @staticmethod
     def _supports_custom_temperature(model: str) -> bool:
@@ -147,23 +244,68 @@ class ProxyAPIClient:
         Returns:
             False если модель не поддерживает кастомный temperature
         """
-        model_lower = model.lower()
+        return not model.lower().startswith(_REASONING_MODEL_PREFIXES)
+    
+    def _get_param_builder(self, model: str) -> Callable[..., Dict[str, Any]]:
+        """
+        Получить построитель параметров запроса для модели
         
-        # Модели с фиксированной temperature
-        fixed_temp_models = [
-            'gpt-5',
-            'o1-preview',
-            'o1-mini',
-            'o3-mini',
-            'o3',
-        ]
+        Особенности модели (temperature, max_tokens / max_completion_tokens)
+        определяются один раз при первом запросе, дальше используется
+        готовый построитель без повторных проверок.
         
-        # Проверяем начинается ли модель с одного из префиксов
-        for fixed_model in fixed_temp_models:
-            if model_lower.startswith(fixed_model):
-                return False
+        Args:
+            model: Название модели
+            
+        Returns:
+            Функция (messages, temperature, max_tokens, json_mode, kwargs) -> params
+        """
+        builder = self._param_builders.get(model)
+        if builder is None:
+            builder = self._make_param_builder(model)
+            self._param_builders[model] = builder
+        return builder
+    
+    @classmethod
+    def _make_param_builder(cls, model: str) -> Callable[..., Dict[str, Any]]:
+        """
+        Создать построитель параметров запроса для модели
         
-        return True
+        Args:
+            model: Название модели
+            
+        Returns:
+            Функция (messages, temperature, max_tokens, json_mode, kwargs) -> params
+        """
+        if cls._uses_max_completion_tokens(model):
+            # GPT-5, O1, O3: temperature только дефолтный, лимит - max_completion_tokens
+            logger.debug(
+                f"Модель {model}: temperature пропускается, используется max_completion_tokens"
+            )
+            
+            def build_reasoning_params(messages, temperature, max_tokens, json_mode, kwargs):
+                params = {"model": model, "messages": messages, **kwargs}
+                if max_tokens:
+                    params["max_completion_tokens"] = max_tokens
+                if json_mode:
+                    params["response_format"] = {"type": "json_object"}
+                return params
+            
+            return build_reasoning_params
+        
+        # GPT-4, GPT-4o, GPT-3.5: настраиваемый temperature, лимит - max_tokens
+        logger.debug(f"Модель {model}: используются temperature и max_tokens")
+        
+        def build_legacy_params(messages, temperature, max_tokens, json_mode, kwargs):
+            params = {"model": model, "messages": messages, **kwargs}
+            params["temperature"] = temperature
+            if max_tokens:
+                params["max_tokens"] = max_tokens
+            if json_mode:
+                params["response_format"] = {"type": "json_object"}
+            return params
+        
+        return build_legacy_params
     
     async def chat_completion(
         self,
@@ -203,6 +345,136 @@ class ProxyAPIClient:
             **Temperature:**
             - Настраиваемый для GPT-4, GPT-4o, GPT-3.5
             - Фиксированный (1.0) для GPT-5, O1, O3 - параметр не передаётся
+            
+            **Повторные попытки:**
+            - APIRateLimitError и APIConnectionError повторяются с экспоненциальной
+              задержкой и jitter (с учётом retry_after, если он известен)
+            - APIAuthenticationError и GenerationError не повторяются
+            
+            **Дедупликация:**
+            - Одинаковые одновременные запросы с temperature <= 0.3 (почти детерминированные)
+              объединяются: к API уходит один запрос, результат получают все вызывающие
+        """
+        if temperature > _DEDUP_MAX_TEMPERATURE:
+            return await self._chat_completion_with_retry(
+                messages, model, temperature, max_tokens, json_mode, **kwargs
+            )
+        
+        key = self._request_key(messages, model, temperature, max_tokens, json_mode, kwargs)
+        
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._chat_completion_with_retry(
+                    messages, model, temperature, max_tokens, json_mode, **kwargs
+                )
+            )
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logger.debug("Запрос объединен с уже выполняющимся | Model: %s", model)
+        
+        # shield: отмена одного из ожидающих не отменяет общий запрос
+        return await asyncio.shield(task)
+    
+    @staticmethod
+    def _request_key(
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        json_mode: bool,
+        kwargs: Dict[str, Any]
+    ) -> str:
+        """
+        Построить ключ запроса для объединения одинаковых запросов
+        
+        Returns:
+            Хэш параметров запроса
+        """
+        payload = json.dumps(
+            {
+                "model": model,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "json_mode": json_mode,
+                "kwargs": kwargs,
+            },
+            sort_keys=True,
+            ensure_ascii=False,
+            default=str
+        )
+        return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+    
+    async def _chat_completion_with_retry(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        json_mode: bool,
+        **kwargs
+    ) -> str:
+        """
+        Запрос chat completion с повторными попытками
+        
+        Параметры и исключения - см. chat_completion.
+        """
+        for attempt in range(_RETRY_ATTEMPTS):
+            try:
+                return await self._chat_completion_once(
+                    messages=messages,
+                    model=model,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    json_mode=json_mode,
+                    **kwargs
+                )
+            except (APIRateLimitError, APIConnectionError) as e:
+                if attempt == _RETRY_ATTEMPTS - 1:
+                    raise
+                
+                delay = self._retry_delay(attempt, getattr(e, "retry_after", None))
+                logger.warning(
+                    f"Попытка {attempt + 1}/{_RETRY_ATTEMPTS} запроса к API не удалась "
+                    f"({type(e).__name__}), повтор через {delay:.1f}s"
+                )
+                await asyncio.sleep(delay)
+    
+    @staticmethod
+    def _retry_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+        """
+        Рассчитать задержку перед повторной попыткой
+        
+        Экспоненциальная задержка с jitter: base * 2^attempt * (1 + jitter),
+        не меньше retry_after от сервера и не больше _RETRY_MAX_DELAY.
+        
+        Args:
+            attempt: Номер неудачной попытки (с 0)
+            retry_after: Рекомендованная сервером задержка в секундах (опционально)
+            
+        Returns:
+            Задержка в секундах
+        """
+        delay = _RETRY_BASE_DELAY * (2 ** attempt) * (1 + random.uniform(0, _RETRY_JITTER))
+        if retry_after:
+            delay = max(delay, retry_after)
+        return min(delay, _RETRY_MAX_DELAY)
+    
+    async def _chat_completion_once(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float,
+        max_tokens: Optional[int],
+        json_mode: bool,
+        **kwargs
+    ) -> str:
+        """
+        Один запрос chat completion без повторных попыток
+        
+        Параметры и исключения - см. chat_completion.
         """
         try:
             log_api_request(logger, "POST", f"{self.base_url}/chat/completions", {
@@ -211,128 +483,211 @@ class ProxyAPIClient:
                 "max_tokens": max_tokens
             })
             
-            # Подготовка параметров
-            params = {
-                "model": model,
-                "messages": messages,
-                **kwargs
-            }
-            
-            # Некоторые модели не поддерживают кастомный temperature (GPT-5, O1, O3)
-            if self._supports_custom_temperature(model):
-                params["temperature"] = temperature
-            else:
-                logger.debug(f"Temperature пропущена для модели {model} (поддерживает только дефолт)")
-            
-            # Выбор правильного параметра для ограничения токенов в зависимости от модели
-            if max_tokens:
-                if self._uses_max_completion_tokens(model):
-                    params["max_completion_tokens"] = max_tokens
-                    logger.debug(f"Используется max_completion_tokens для модели {model}")
-                else:
-                    params["max_tokens"] = max_tokens
-                    logger.debug(f"Используется max_tokens для модели {model}")
-            
-            if json_mode:
-                params["response_format"] = {"type": "json_object"}
+            # Подготовка параметров (построитель специализирован под модель)
+            build_params = self._get_param_builder(model)
+            params = build_params(messages, temperature, max_tokens, json_mode, kwargs)
             
             # Запрос к API
-            import time
-            start_time = time.time()
+            start_time = time.monotonic()
             
-            response: ChatCompletion = await self.client.chat.completions.create(**params)
+            async with self._chat_semaphore:
+                response: ChatCompletion = await self._chat_client.chat.completions.create(**params)
             
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.monotonic() - start_time
             log_api_response(logger, 200, elapsed_time, success=True)
             
             # Извлечение текста из ответа
-            if not response.choices:
+            choices = response.choices
+            if not choices:
                 logger.error(f"API вернул ответ без choices | Model: {model}")
                 raise GenerationError("API вернул пустой ответ без choices")
             
-            choice = response.choices[0]
+            # Поля ответа читаются один раз и дальше используются как локальные переменные
+            choice = choices[0]
             message = choice.message
+            finish_reason = choice.finish_reason
+            content = message.content
+            refusal = message.refusal if _MESSAGE_HAS_REFUSAL else None
             
             # Логируем детали ответа для отладки
-            logger.debug(f"Response details | finish_reason: {choice.finish_reason} | role: {message.role}")
+            logger.debug("Response details | finish_reason: %s | role: %s", finish_reason, message.role)
             
             # Проверяем refusal (отказ модели)
-            if hasattr(message, 'refusal') and message.refusal:
-                logger.warning(f"Модель отказала в генерации | Reason: {message.refusal}")
-                raise GenerationError(f"Модель отказала в генерации контента: {message.refusal}")
-            
-            content = message.content
+            if refusal:
+                logger.warning(f"Модель отказала в генерации | Reason: {refusal}")
+                raise GenerationError(f"Модель отказала в генерации контента: {refusal}")
             
             if not content:
                 # Детальное логирование для отладки
-                logger.error(f"Пустой контент | Model: {model} | finish_reason: {choice.finish_reason}")
-                logger.error(f"Full response: {response.model_dump_json()}")
-                raise GenerationError(f"API вернул пустой контент (finish_reason: {choice.finish_reason})")
-            
-            logger.debug(f"Получен ответ длиной {len(content)} символов")
+                logger.error(f"Пустой контент | Model: {model} | finish_reason: {finish_reason}")
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.error(f"Full response: {response.model_dump_json()}")
+                raise GenerationError(f"API вернул пустой контент (finish_reason: {finish_reason})")
+            
+            logger.debug("Получен ответ длиной %d символов", len(content))
+            
+            # Попадание в кэш промптов провайдера (неизменный префикс промпта)
+            if logger.isEnabledFor(logging.DEBUG) and response.usage is not None:
+                details = getattr(response.usage, "prompt_tokens_details", None)
+                logger.debug(
+                    "Токены промпта: %d | из кэша: %s",
+                    response.usage.prompt_tokens,
+                    getattr(details, "cached_tokens", None)
+                )
             
             return content
             
-        except httpx.TimeoutException as e:
+        except GenerationError:
+            raise
+        
+        except Exception as e:
+            raise self._convert_api_error(e)
+    
+    def _convert_api_error(self, e: Exception) -> APIError:
+        """
+        Преобразовать ошибку OpenAI SDK в исключение бота (с логированием)
+        
+        Args:
+            e: Исходная ошибка
+            
+        Returns:
+            Исключение для выброса
+        """
+        if isinstance(e, openai.APITimeoutError):
             log_exception(logger, e, "Timeout при запросе к API")
-            raise APIConnectionError(
+            return APIConnectionError(
                 "Превышено время ожидания ответа от API",
                 original_error=e
             )
         
-        except httpx.ConnectError as e:
+        if isinstance(e, openai.APIConnectionError):
             log_exception(logger, e, "Ошибка соединения с API")
-            raise APIConnectionError(
+            return APIConnectionError(
                 "Не удалось подключиться к API. Проверьте интернет-соединение",
                 original_error=e
             )
         
-        except Exception as e:
-            # Обработка специфичных ошибок OpenAI
-            error_message = str(e).lower()
+        if isinstance(e, openai.RateLimitError):
+            log_exception(logger, e, "Rate limit превышен")
+            return APIRateLimitError(
+                "Превышен лимит запросов к API. Попробуйте позже",
+                retry_after=self._parse_retry_after(e),
+                original_error=e
+            )
+        
+        if isinstance(e, (openai.AuthenticationError, openai.PermissionDeniedError)):
+            log_exception(logger, e, "Ошибка аутентификации")
+            return APIAuthenticationError(
+                "Неверный API ключ или недостаточно прав",
+                original_error=e
+            )
+        
+        if isinstance(e, openai.APIStatusError):
+            log_exception(logger, e, "Ошибка API при генерации текста")
+            return APIError(
+                f"Ошибка API: {str(e)}",
+                status_code=e.status_code,
+                original_error=e
+            )
+        
+        log_exception(logger, e, "Неожиданная ошибка при генерации текста")
+        return APIError(
+            f"Ошибка API: {str(e)}",
+            original_error=e
+        )
+    
+    async def chat_completion_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str = "gpt-4o-mini",
+        temperature: float = 0.7,
+        max_tokens: Optional[int] = None,
+        json_mode: bool = False,
+        **kwargs
+    ) -> AsyncIterator[str]:
+        """
+        Потоковая генерация текста через chat completion
+        
+        Отдает фрагменты ответа по мере генерации - первые данные доступны
+        задолго до конца ответа. Повторные попытки и дедупликация не применяются:
+        часть ответа к моменту ошибки уже может быть отдана вызывающему.
+        
+        Args:
+            messages: Список сообщений в формате [{"role": "user", "content": "..."}]
+            model: Модель для использования
+            temperature: Креативность (0.0-2.0)
+            max_tokens: Максимальное количество токенов в ответе
+            json_mode: Требовать JSON ответ
+            **kwargs: Дополнительные параметры для API
             
-            if "429" in error_message or "rate limit" in error_message:
-                log_exception(logger, e, "Rate limit превышен")
-                raise APIRateLimitError(
-                    "Превышен лимит запросов к API. Попробуйте позже",
-                    retry_after=60,
-                    original_error=e
-                )
+        Yields:
+            Фрагменты сгенерированного текста
             
-            elif "401" in error_message or "unauthorized" in error_message or "api key" in error_message:
-                log_exception(logger, e, "Ошибка аутентификации")
-                raise APIAuthenticationError(
-                    "Неверный API ключ или недостаточно прав",
-                    original_error=e
-                )
+        Raises:
+            APIError: При ошибках API
+        """
+        log_api_request(logger, "POST", f"{self.base_url}/chat/completions", {
+            "model": model,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True
+        })
+        
+        build_params = self._get_param_builder(model)
+        params = build_params(messages, temperature, max_tokens, json_mode, kwargs)
+        
+        start_time = time.monotonic()
+        
+        try:
+            async with self._stream_semaphore:
+                stream = await self.client.chat.completions.create(stream=True, **params)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        yield chunk.choices[0].delta.content
+        
+        except Exception as e:
+            raise self._convert_api_error(e)
+        
+        elapsed_time = time.monotonic() - start_time
+        log_api_response(logger, 200, elapsed_time, success=True)
+    
+    @staticmethod
+    def _parse_retry_after(error: openai.APIStatusError) -> Optional[float]:
+        """
+        Извлечь Retry-After из ответа API
+        
+        Args:
+            error: Ошибка API с HTTP ответом
             
-            else:
-                log_exception(logger, e, "Неожиданная ошибка при генерации текста")
-                raise APIError(
-                    f"Ошибка API: {str(e)}",
-                    original_error=e
-                )
+        Returns:
+            Задержка в секундах или None, если заголовок отсутствует или не число
+        """
+        value = error.response.headers.get("retry-after")
+        if value is None:
+            return None
+        
+        try:
+            return float(value)
+        except ValueError:
+            return None
     
-    async def generate_image(
+    async def _generate_image_data(
         self,
         prompt: str,
-        model: str = "dall-e-3",
-        size: str = "1024x1024",
-        quality: str = "standard",
-        n: int = 1
-    ) -> str:
+        model: str,
+        size: str,
+        quality: str,
+        n: int,
+        response_format: str
+    ) -> Image:
         """
-        Генерация изображения через DALL-E
+        Запрос генерации изображения (общая часть generate_image и generate_image_bytes)
         
         Args:
-            prompt: Описание изображения на английском
-            model: Модель (dall-e-2, dall-e-3)
-            size: Размер изображения (1024x1024, 1792x1024, 1024x1792 для DALL-E 3)
-            quality: Качество (standard, hd для DALL-E 3)
-            n: Количество изображений (1-10, для DALL-E 3 только 1)
+            response_format: Формат ответа API: "url" или "b64_json"
             
         Returns:
-            URL сгенерированного изображения
+            Первое изображение из ответа API
             
         Raises:
             ImageGenerationError: При ошибках генерации
@@ -341,33 +696,36 @@ class ProxyAPIClient:
             log_api_request(logger, "POST", f"{self.base_url}/images/generations", {
                 "model": model,
                 "size": size,
-                "quality": quality
+                "quality": quality,
+                "response_format": response_format
             })
             
-            import time
-            start_time = time.time()
+            start_time = time.monotonic()
             
             # Генерация изображения
-            response: ImagesResponse = await self.client.images.generate(
-                model=model,
-                prompt=prompt,
-                size=size,
-                quality=quality if model == "dall-e-3" else "standard",
-                n=n if model != "dall-e-3" else 1  # DALL-E 3 поддерживает только n=1
-            )
+            async with self._image_semaphore:
+                response: ImagesResponse = await self.client.images.generate(
+                    model=model,
+                    prompt=prompt,
+                    size=size,
+                    quality=quality if model == "dall-e-3" else "standard",
+                    n=n if model != "dall-e-3" else 1,  # DALL-E 3 поддерживает только n=1
+                    response_format=response_format
+                )
             
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.monotonic() - start_time
             log_api_response(logger, 200, elapsed_time, success=True)
             
             if not response.data:
                 raise ImageGenerationError("API вернул пустой ответ без изображений")
             
-            image_url = response.data[0].url
-            
             logger.info(f"Изображение сгенерировано успешно | Time: {elapsed_time:.2f}s")
             
-            return image_url
+            return response.data[0]
             
+        except ImageGenerationError:
+            raise
+        
         except Exception as e:
             error_message = str(e).lower()
             
@@ -393,6 +751,77 @@ class ProxyAPIClient:
                     original_error=e
                 )
     
+    async def generate_image(
+        self,
+        prompt: str,
+        model: str = "dall-e-3",
+        size: str = "1024x1024",
+        quality: str = "standard",
+        n: int = 1
+    ) -> str:
+        """
+        Генерация изображения через DALL-E
+        
+        Args:
+            prompt: Описание изображения на английском
+            model: Модель (dall-e-2, dall-e-3)
+            size: Размер изображения (1024x1024, 1792x1024, 1024x1792 для DALL-E 3)
+            quality: Качество (standard, hd для DALL-E 3)
+            n: Количество изображений (1-10, для DALL-E 3 только 1)
+            
+        Returns:
+            URL сгенерированного изображения
+            
+        Raises:
+            ImageGenerationError: При ошибках генерации
+        """
+        image = await self._generate_image_data(prompt, model, size, quality, n, "url")
+        return image.url
+    
+    async def generate_image_bytes(
+        self,
+        prompt: str,
+        model: str = "dall-e-3",
+        size: str = "1024x1024",
+        quality: str = "standard",
+        save_path: Optional[Path] = None
+    ) -> Tuple[Optional[str], bytes]:
+        """
+        Генерация изображения с получением байтов в том же ответе API
+        
+        Изображение запрашивается в base64 (response_format="b64_json"), поэтому
+        отдельное скачивание по URL не нужно. Если API все же вернул только URL,
+        изображение скачивается через download_image.
+        
+        Args:
+            prompt: Описание изображения на английском
+            model: Модель (dall-e-2, dall-e-3)
+            size: Размер изображения
+            quality: Качество (standard, hd для DALL-E 3)
+            save_path: Путь для сохранения (опционально)
+            
+        Returns:
+            Кортеж (URL изображения или None, байты изображения)
+            
+        Raises:
+            ImageGenerationError: При ошибках генерации
+            APIConnectionError: При ошибках скачивания (если API вернул только URL)
+        """
+        image = await self._generate_image_data(prompt, model, size, quality, 1, "b64_json")
+        
+        if not image.b64_json:
+            if not image.url:
+                raise ImageGenerationError("API вернул изображение без данных и URL")
+            return image.url, await self.download_image(image.url, save_path)
+        
+        image_bytes = base64.b64decode(image.b64_json)
+        
+        if save_path:
+            await asyncio.to_thread(_write_file, save_path, image_bytes)
+            logger.info(f"Изображение сохранено: {save_path}")
+        
+        return image.url, image_bytes
+    
     async def download_image(self, image_url: str, save_path: Optional[Path] = None) -> bytes:
         """
         Скачивание изображения по URL
@@ -410,20 +839,31 @@ class ProxyAPIClient:
         try:
             logger.debug(f"Скачивание изображения: {image_url}")
             
-            async with httpx.AsyncClient(timeout=30) as client:
-                response = await client.get(image_url)
+            image_bytes = bytearray()
+            
+            # Тело читается потоково: при сохранении на диск каждый чанк
+            # пишется в отдельном потоке, не блокируя event loop
+            async with self._download_client.stream("GET", image_url) as response:
                 response.raise_for_status()
                 
-                image_bytes = response.content
-                
-                # Сохранение файла, если указан путь
+                file = None
                 if save_path:
-                    save_path.parent.mkdir(parents=True, exist_ok=True)
-                    save_path.write_bytes(image_bytes)
-                    logger.info(f"Изображение сохранено: {save_path}")
+                    file = await asyncio.to_thread(_open_for_write, save_path)
                 
-                logger.debug(f"Изображение скачано: {len(image_bytes)} байт")
-                return image_bytes
+                try:
+                    async for chunk in response.aiter_bytes(_DOWNLOAD_CHUNK_SIZE):
+                        image_bytes += chunk
+                        if file:
+                            await asyncio.to_thread(file.write, chunk)
+                finally:
+                    if file:
+                        await asyncio.to_thread(file.close)
+            
+            if save_path:
+                logger.info(f"Изображение сохранено: {save_path}")
+            
+            logger.debug(f"Изображение скачано: {len(image_bytes)} байт")
+            return bytes(image_bytes)
                 
         except Exception as e:
             log_exception(logger, e, "Ошибка скачивания изображения")
@@ -432,17 +872,60 @@ class ProxyAPIClient:
                 original_error=e
             )
     
+    async def create_embedding(
+        self,
+        text: str,
+        model: str = "text-embedding-3-small"
+    ) -> List[float]:
+        """
+        Получение эмбеддинга текста
+        
+        Args:
+            text: Текст для векторизации
+            model: Модель эмбеддингов
+            
+        Returns:
+            Вектор эмбеддинга
+            
+        Raises:
+            APIError: При ошибках запроса
+        """
+        try:
+            start_time = time.monotonic()
+            
+            async with self._chat_semaphore:
+                response = await self.client.embeddings.create(
+                    model=model,
+                    input=text
+                )
+            
+            elapsed_time = time.monotonic() - start_time
+            logger.debug("Эмбеддинг получен | Model: %s | Time: %.2fs", model, elapsed_time)
+            
+            return response.data[0].embedding
+            
+        except Exception as e:
+            log_exception(logger, e, "Ошибка получения эмбеддинга")
+            raise APIError(
+                f"Не удалось получить эмбеддинг: {str(e)}",
+                original_error=e
+            )
+    
     async def transcribe_audio(
         self,
-        audio_file_path: Path,
+        audio_file: BinaryIO,
+        filename: str = "voice.ogg",
         model: str = "whisper-1",
         language: Optional[str] = "ru"
     ) -> str:
         """
         Транскрибация аудио через Whisper
         
+        Аудио передается из памяти, без записи во временный файл.
+        
         Args:
-            audio_file_path: Путь к аудио файлу
+            audio_file: Файловый объект с аудио (например, io.BytesIO)
+            filename: Имя файла для API (по расширению определяется формат)
             model: Модель (whisper-1)
             language: Язык аудио (ru, en, etc.)
             
@@ -453,27 +936,22 @@ class ProxyAPIClient:
             TranscriptionError: При ошибках транскрибации
         """
         try:
-            if not audio_file_path.exists():
-                raise TranscriptionError(f"Аудио файл не найден: {audio_file_path}")
-            
             log_api_request(logger, "POST", f"{self.base_url}/audio/transcriptions", {
                 "model": model,
                 "language": language
             })
             
-            import time
-            start_time = time.time()
+            start_time = time.monotonic()
             
-            # Открываем файл в бинарном режиме
-            with open(audio_file_path, "rb") as audio_file:
-                # Транскрибация
+            # Транскрибация
+            async with self._transcription_semaphore:
                 response = await self.client.audio.transcriptions.create(
                     model=model,
-                    file=audio_file,
+                    file=(filename, audio_file),
                     language=language
                 )
             
-            elapsed_time = time.time() - start_time
+            elapsed_time = time.monotonic() - start_time
             log_api_response(logger, 200, elapsed_time, success=True)
             
             text = response.text.strip()
@@ -482,13 +960,6 @@ class ProxyAPIClient:
             
             return text
             
-        except FileNotFoundError as e:
-            log_exception(logger, e, "Файл не найден")
-            raise TranscriptionError(
-                f"Аудио файл не найден: {audio_file_path}",
-                original_error=e
-            )
-        
         except Exception as e:
             log_exception(logger, e, "Ошибка транскрибации")
             raise TranscriptionError(
@@ -503,24 +974,32 @@ class ProxyAPIClient:
         Returns:
             True если подключение успешно, False иначе
         """
+        if (
+            self._validated_at is not None
+            and time.monotonic() - self._validated_at < _VALIDATION_TTL
+        ):
+            logger.debug("Подключение к ProxyAPI проверено недавно, повторная проверка пропущена")
+            return True
+        
         try:
             logger.info("Проверка подключения к ProxyAPI...")
             
-            # Простой тестовый запрос
-            await self.chat_completion(
-                messages=[{"role": "user", "content": "Hi"}],
-                max_tokens=10
-            )
+            # Список моделей - дешевый запрос без генерации и расхода токенов
+            await self.client.models.list()
             
+            self._validated_at = time.monotonic()
             logger.info("✓ Подключение к ProxyAPI успешно")
             return True
             
         except Exception as e:
+            self._validated_at = None
             logger.error(f"✗ Ошибка подключения к ProxyAPI: {str(e)}")
             return False
     
     async def close(self):
         """Закрытие клиента и освобождение ресурсов"""
         await self.client.close()
+        await self._http_client.aclose()
+        await self._download_client.aclose()
         logger.debug("ProxyAPI клиент закрыт")
 
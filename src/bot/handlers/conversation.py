@@ -5,18 +5,34 @@ Handler для основного диалога
 """
 
 import io
+import re
+import time
+import random
 import asyncio
-from aiogram import Router, F
+import unicodedata
+from typing import Dict, List, Optional, Tuple
+from aiogram import Bot, Router, F
 from aiogram.types import Message, CallbackQuery, BufferedInputFile
 from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramRetryAfter
 
 from core.logger import get_logger, log_user_action, log_exception
+from core.cache import LRUCache
 from core.exceptions import GenerationError, ModerationError
-from bot.states import ContentGenerationStates, get_state_question
+from bot.states import (
+    ContentGenerationStates,
+    ContentContext,
+    IDEAS_DESTINY,
+    clear_dialog,
+    clear_ideas,
+    get_state_question,
+    get_storage_key
+)
 from bot.keyboards import get_ideas_keyboard, get_continue_keyboard, get_yes_no_keyboard, get_main_keyboard
 from bot.utils import (
     send_with_typing,
     send_typing_action,
+    run_with_typing,
     format_ideas_message,
     format_post_with_hashtags,
     safe_send_message
@@ -25,6 +41,8 @@ from services.moderation import ModerationService
 from services.idea_generator import IdeaGenerator
 from services.post_generator import PostGenerator
 from api.proxyapi_client import ProxyAPIClient
+from prompts.builders import PromptBuilder
+from prompts.templates import PromptTemplates
 
 logger = get_logger(__name__)
 
@@ -37,6 +55,55 @@ idea_generator: IdeaGenerator = None
 post_generator: PostGenerator = None
 api_client: ProxyAPIClient = None
 
+# Кэш переформулировок: (контекст, нормализованный текст) -> результат
+_reformulation_cache = LRUCache(maxsize=2048)
+
+# Выполняющиеся переформулировки: ключ кэша -> задача (single-flight)
+_reformulation_inflight: Dict[tuple, asyncio.Future] = {}
+
+# Дательный падеж форматов для вопроса об иллюстрации ("к посту", "к статье"):
+# основа слова (ищется подстрокой, как "постов", "статьи") -> форма в дательном падеже
+_DATIVE_FORMS = (
+    ("пост", "посту"),
+    ("стать", "статье"),
+    ("сценари", "сценарию"),
+)
+# "Пост для Instagram" - формат целиком ставится в дательный падеж
+_DATIVE_PHRASE_RE = re.compile(r"(пост|статья|сценарий)(\s+для\s.*)", re.DOTALL)
+_DATIVE_PHRASE_FORMS = {"пост": "посту", "статья": "статье", "сценарий": "сценарию"}
+_MAILING_RE = re.compile("email|письмо|рассылка")
+
+# Минимальный интервал между правками сообщения с идеями во время генерации
+# (Telegram ограничивает частоту редактирования сообщений)
+_IDEAS_EDIT_INTERVAL = 1.0
+
+# Разделитель вокруг текста готового поста
+_POST_SEPARATOR = "━" * 30
+
+# Повторные попытки отправки изображения (экспоненциальная задержка с jitter)
+_PHOTO_SEND_ATTEMPTS = 3
+_PHOTO_RETRY_BASE_DELAY = 0.5
+_PHOTO_RETRY_MAX_DELAY = 30.0
+_PHOTO_RETRY_JITTER = 0.5
+
+# Заранее запущенная генерация поста для первой идеи:
+# chat_id -> (ID идеи, задача, время запуска по time.monotonic).
+# Задачи нельзя хранить в FSM, поэтому они живут в памяти процесса; записи
+# брошенных диалогов удаляются по возрасту и общему количеству
+_prewarmed_posts: Dict[int, Tuple[str, asyncio.Task, float]] = {}
+_PREWARMED_POST_TTL = 15 * 60
+_MAX_PREWARMED_POSTS = 1000
+
+# Форматы, которые не требуют изображения (поиск подстроки без учета регистра)
+_WITHOUT_IMAGE_KEYWORDS = (
+    "сценарий", "скрипт", "инструкция", "план", "текст",
+    "email", "письмо", "рассылка", "описание"
+)
+_WITHOUT_IMAGE_RE = re.compile(
+    "|".join(map(re.escape, _WITHOUT_IMAGE_KEYWORDS)),
+    re.IGNORECASE
+)
+
 
 def setup_services(moderation: ModerationService, ideas: IdeaGenerator, posts: PostGenerator, api: ProxyAPIClient):
     """Установить сервисы для handlers"""
@@ -51,59 +118,26 @@ def setup_services(moderation: ModerationService, ideas: IdeaGenerator, posts: P
 # HELPER FUNCTIONS
 # ============================================================================
 
-async def reformulate_user_input(user_text: str, context: str) -> str:
+def _reformulation_key(context: str, user_text: str) -> tuple:
     """
-    Переформулировать ввод пользователя в грамотную форму
+    Ключ кэша переформулировки
     
-    Args:
-        user_text: Текст пользователя (например, "я хлеб пеку")
-        context: Контекст ('niche', 'goal', 'format')
-        
-    Returns:
-        Грамотно сформулированный текст (например, "Выпечка хлеба")
+    Текст приводится к NFKC, нижнему регистру и схлопываются пробелы,
+    чтобы "Фитнес ", "фитнес" и "ФИТНЕС" попадали в одну запись.
     """
-    try:
-        if context == 'niche':
-            prompt = f"""Переформулируй текст пользователя в грамотную форму для описания ниши/темы.
-
-Пользователь написал: "{user_text}"
-
-Правила:
-- Если написано как действие ("я хлеб пеку", "делаю мебель"), преобразуй в существительное ("Выпечка хлеба", "Изготовление мебели")
-- Если написано некорректно ("собираю машины"), сделай грамотно ("Сборка автомобилей")
-- Сохрани смысл, но сделай формулировку профессиональной
-- Максимум 3-5 слов
-- Только суть, без лишних слов
-
-Ответь ТОЛЬКО переформулированным текстом, без объяснений."""
-
-        elif context == 'goal':
-            prompt = f"""Переформулируй цель пользователя в грамотную форму.
-
-Пользователь написал: "{user_text}"
-
-Правила:
-- Преобразуй в инфинитив если нужно ("хочу клиентов" → "Привлечение клиентов")
-- Сделай формулировку четкой и профессиональной  
-- Сохрани смысл
-- Максимум 5-7 слов
-
-Ответь ТОЛЬКО переформулированным текстом, без объяснений."""
+    normalized = unicodedata.normalize("NFKC", user_text).lower()
+    return context, " ".join(normalized.split())
 
-        elif context == 'format':
-            prompt = f"""Переформулируй формат контента в грамотную форму.
 
-Пользователь написал: "{user_text}"
-
-Правила:
-- Сделай формулировку четкой ("пост инсте" → "Пост для Instagram")
-- Сохрани смысл
-- Максимум 5-7 слов
-
-Ответь ТОЛЬКО переформулированным текстом, без объяснений."""
-        
-        else:
-            return user_text
+async def _request_reformulation(user_text: str, context: str) -> Optional[str]:
+    """
+    Переформулировать текст запросом к AI и сохранить результат в кэш
+    
+    Returns:
+        Переформулированный текст или None при ошибке
+    """
+    try:
+        prompt = PromptBuilder.build_reformulation_prompt(context, user_text)
         
         # Запрос к AI
         response = await api_client.chat_completion(
@@ -114,13 +148,56 @@ async def reformulate_user_input(user_text: str, context: str) -> str:
         )
         
         reformulated = response.strip().strip('"').strip("'")
-        logger.debug(f"Переформулировка | '{user_text}' → '{reformulated}'")
+        if not reformulated:
+            logger.warning(f"Пустая переформулировка для поля '{context}', используем оригинал")
+            return None
         
+        logger.debug(f"Переформулировка | '{user_text}' → '{reformulated}'")
+        _reformulation_cache.set(_reformulation_key(context, user_text), reformulated)
         return reformulated
         
     except Exception as e:
         logger.warning(f"Ошибка переформулировки, используем оригинал: {e}")
-        return user_text  # В случае ошибки возвращаем оригинал
+        return None
+
+
+async def reformulate_user_input(user_text: str, context: str) -> str:
+    """
+    Переформулировать ввод пользователя в грамотную форму
+    
+    Args:
+        user_text: Текст пользователя (например, "я хлеб пеку")
+        context: Контекст ('niche', 'goal', 'format')
+        
+    Returns:
+        Грамотно сформулированный текст (например, "Выпечка хлеба").
+        При ошибке возвращается исходный текст.
+    """
+    if context not in PromptTemplates.REFORMULATION_RULES:
+        return user_text
+    
+    # Повторяющиеся формулировки ("фитнес", "бизнес") берем из кэша без запроса к AI,
+    # а уже выполняющуюся переформулировку того же текста ожидаем, а не дублируем
+    key = _reformulation_key(context, user_text)
+    cached = _reformulation_cache.get(key)
+    if cached is not None:
+        logger.debug(f"Переформулировка из кэша | '{user_text}' → '{cached}'")
+        return cached
+    
+    future = _reformulation_inflight.get(key)
+    if future is not None:
+        # None - переформулировка не удалась, используем оригинал
+        return await asyncio.shield(future) or user_text
+    
+    future = _reformulation_inflight[key] = asyncio.get_running_loop().create_future()
+    reformulated = None
+    try:
+        reformulated = await _request_reformulation(user_text, context)
+    finally:
+        _reformulation_inflight.pop(key, None)
+        future.set_result(reformulated)
+    
+    return reformulated or user_text
 
 async def check_and_moderate(
     message: Message,
@@ -158,58 +235,118 @@ async def check_and_moderate(
                 "До встречи! 👋",
                 reply_markup=get_main_keyboard()
             )
-            await state.clear()
+            await clear_dialog(state)
             return False
     
-    # Проверка релевантности через AI
-    try:
-        result = await moderation_service.check_relevance(
-            current_step=current_step,
-            bot_question=bot_question,
-            user_response=user_response
-        )
-        
-        if result["is_relevant"]:
-            # Сбрасываем счетчик если ответ релевантен
+    # Очевидно релевантные ответы (короткие или по теме диалога) не отправляем в AI
+    if moderation_service.is_obviously_relevant(
+        user_response,
+        [data.get("niche", ""), data.get("goal", "")]
+    ):
+        if off_topic_count:
             await state.update_data(off_topic_count=0)
-            return True
-        
-        # Сообщение нерелевантно
-        off_topic_count += 1
-        await state.update_data(off_topic_count=off_topic_count)
-        
-        # Проверяем, нужно ли завершить диалог
-        if moderation_service.should_end_conversation(off_topic_count):
-            await message.answer(
-                moderation_service.get_redirection_message(
-                    off_topic_count, 
-                    bot_question
-                ),
-                reply_markup=get_main_keyboard()
-            )
-            await state.clear()
-            return False
-        
-        # Возвращаем к теме
-        redirect_msg = moderation_service.get_redirection_message(
-            off_topic_count,
-            bot_question,
-            result.get("suggestion")
-        )
-        
-        await send_with_typing(
-            bot=message.bot,
-            chat_id=message.chat.id,
-            text=redirect_msg,
-            reply_markup=get_main_keyboard()
+        return True
+    
+    # Проверка релевантности через AI. Большинство ответов релевантны, поэтому
+    # долгую проверку не ждем: по истечении тайм-аута ответ принимается, а проверка
+    # завершается в фоне (ее результат попадет в кэш модерации)
+    relevance_task = asyncio.create_task(moderation_service.check_relevance(
+        current_step=current_step,
+        bot_question=bot_question,
+        user_response=user_response
+    ))
+    try:
+        result = await asyncio.wait_for(
+            asyncio.shield(relevance_task),
+            timeout=moderation_service.settings.moderation_timeout
         )
-        
-        return False
-        
+    except asyncio.TimeoutError:
+        logger.warning("Проверка релевантности не уложилась в тайм-аут, считаем сообщение релевантным")
+        # Исключение фоновой проверки забираем, чтобы asyncio не ругался на необработанную ошибку
+        relevance_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        return True
     except ModerationError as e:
         logger.error(f"Ошибка модерации: {e}")
         # В случае ошибки модерации, считаем сообщение релевантным
         return True
+    
+    if result["is_relevant"]:
+        # Сбрасываем счетчик если ответ релевантен
+        await state.update_data(off_topic_count=0)
+        return True
+    
+    # Сообщение нерелевантно
+    off_topic_count += 1
+    await state.update_data(off_topic_count=off_topic_count)
+    
+    # Проверяем, нужно ли завершить диалог
+    if moderation_service.should_end_conversation(off_topic_count):
+        await message.answer(
+            moderation_service.get_redirection_message(
+                off_topic_count, 
+                bot_question
+            ),
+            reply_markup=get_main_keyboard()
+        )
+        await clear_dialog(state)
+        return False
+    
+    # Возвращаем к теме
+    redirect_msg = moderation_service.get_redirection_message(
+        off_topic_count,
+        bot_question,
+        result.get("suggestion")
+    )
+    
+    await send_with_typing(
+        bot=message.bot,
+        chat_id=message.chat.id,
+        text=redirect_msg,
+        reply_markup=get_main_keyboard()
+    )
+    
+    return False
+
+
+async def moderate_and_reformulate(
+    message: Message,
+    state: FSMContext,
+    current_step: str,
+    context: str
+) -> Optional[str]:
+    """
+    Проверить сообщение и параллельно переформулировать ввод пользователя
+    
+    Модерация и переформулировка - независимые запросы к AI, поэтому
+    выполняются одновременно через asyncio.gather: время ожидания
+    равно самому долгому запросу, а не их сумме. Индикатор печати
+    отправляется в том же gather.
+    
+    Args:
+        message: Сообщение пользователя
+        state: FSM контекст
+        current_step: Текущий этап диалога (COLLECTING_NICHE, ...)
+        context: Контекст переформулировки ('niche', 'goal', 'format')
+        
+    Returns:
+        Переформулированный текст или None, если сообщение не прошло модерацию
+    """
+    # Индикатор печати показываем сразу, пока идут запросы к AI
+    is_relevant, formatted, _ = await asyncio.gather(
+        check_and_moderate(
+            message,
+            state,
+            current_step,
+            get_state_question(current_step)
+        ),
+        reformulate_user_input(message.text.strip(), context),
+        send_typing_action(message.bot, message.chat.id, duration=0)
+    )
+    
+    if not is_relevant:
+        return None
+    
+    return formatted
 
 
 # ============================================================================
@@ -222,24 +359,14 @@ async def handle_niche(message: Message, state: FSMContext):
     user_id = message.from_user.id
     log_user_action(logger, user_id, "Ввод ниши", message.text[:50])
     
-    # Модерация
-    if not await check_and_moderate(
-        message,
-        state,
-        "COLLECTING_NICHE",
-        get_state_question("COLLECTING_NICHE")
-    ):
+    # Модерация + переформулировка для красивого ответа (параллельно)
+    niche_formatted = await moderate_and_reformulate(message, state, "COLLECTING_NICHE", 'niche')
+    if niche_formatted is None:
         return
     
     # Сохраняем оригинал
     niche_original = message.text.strip()
     
-    # Переформулируем для красивого ответа
-    niche_formatted = await reformulate_user_input(niche_original, 'niche')
-    
-    # Сохраняем оригинал (для генерации контента)
-    await state.update_data(niche=niche_original)
-    
     # Переходим к сбору цели
     response_text = f"""Отлично! **{niche_formatted}** - интересная ниша 💡
 
@@ -252,12 +379,16 @@ async def handle_niche(message: Message, state: FSMContext):
 • Повысить вовлеченность
 • Что-то другое?"""
     
-    await send_with_typing(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=response_text,
-        parse_mode="Markdown",
-        reply_markup=get_main_keyboard()
+    # Сохраняем оригинал (для генерации контента) параллельно с отправкой ответа
+    await asyncio.gather(
+        state.update_data(niche=niche_original),
+        send_with_typing(
+            bot=message.bot,
+            chat_id=message.chat.id,
+            text=response_text,
+            parse_mode="Markdown",
+            reply_markup=get_main_keyboard()
+        )
     )
     
     await state.set_state(ContentGenerationStates.COLLECTING_GOAL)
@@ -269,24 +400,14 @@ async def handle_goal(message: Message, state: FSMContext):
     user_id = message.from_user.id
     log_user_action(logger, user_id, "Ввод цели", message.text[:50])
     
-    # Модерация
-    if not await check_and_moderate(
-        message,
-        state,
-        "COLLECTING_GOAL",
-        get_state_question("COLLECTING_GOAL")
-    ):
+    # Модерация + переформулировка для красивого ответа (параллельно)
+    goal_formatted = await moderate_and_reformulate(message, state, "COLLECTING_GOAL", 'goal')
+    if goal_formatted is None:
         return
     
     # Сохраняем оригинал
     goal_original = message.text.strip()
     
-    # Переформулируем для красивого ответа
-    goal_formatted = await reformulate_user_input(goal_original, 'goal')
-    
-    # Сохраняем оригинал (для генерации контента)
-    await state.update_data(goal=goal_original)
-    
     # Переходим к сбору формата
     response_text = f"""Понял! **{goal_formatted}** 🎯
 
@@ -299,12 +420,16 @@ async def handle_goal(message: Message, state: FSMContext):
 • Email-рассылка
 • Что-то другое?"""
     
-    await send_with_typing(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=response_text,
-        parse_mode="Markdown",
-        reply_markup=get_main_keyboard()
+    # Сохраняем оригинал (для генерации контента) параллельно с отправкой ответа
+    await asyncio.gather(
+        state.update_data(goal=goal_original),
+        send_with_typing(
+            bot=message.bot,
+            chat_id=message.chat.id,
+            text=response_text,
+            parse_mode="Markdown",
+            reply_markup=get_main_keyboard()
+        )
     )
     
     await state.set_state(ContentGenerationStates.COLLECTING_FORMAT)
@@ -316,82 +441,96 @@ async def handle_format(message: Message, state: FSMContext):
     user_id = message.from_user.id
     log_user_action(logger, user_id, "Ввод формата", message.text[:50])
     
-    # Модерация
-    if not await check_and_moderate(
-        message,
-        state,
-        "COLLECTING_FORMAT",
-        get_state_question("COLLECTING_FORMAT")
-    ):
+    # Модерация + переформулировка для красивого ответа (параллельно)
+    format_formatted = await moderate_and_reformulate(message, state, "COLLECTING_FORMAT", 'format')
+    if format_formatted is None:
         return
     
     # Сохраняем оригинал
     format_original = message.text.strip()
     
-    # Переформулируем для красивого ответа
-    format_formatted = await reformulate_user_input(format_original, 'format')
-    
-    # Сохраняем оба варианта
-    await state.update_data(
-        format_type=format_original,  # Для генерации контента
-        format_formatted=format_formatted  # Для красивого отображения
+    # Сохраняем оба варианта и сообщаем о начале генерации (параллельно)
+    await asyncio.gather(
+        state.update_data(
+            format_type=format_original,  # Для генерации контента
+            format_formatted=format_formatted  # Для красивого отображения
+        ),
+        send_with_typing(
+            bot=message.bot,
+            chat_id=message.chat.id,
+            text=f"Супер! **{format_formatted}** ✨\n\nСейчас подумаю и предложу тебе **5 крутых идей** для контента! 🤔",
+            parse_mode="Markdown",
+            typing_duration=2,
+            reply_markup=get_main_keyboard()
+        )
     )
     
     # Получаем все собранные данные
-    data = await state.get_data()
-    niche = data.get("niche")
-    goal = data.get("goal")
-    
-    # Сообщаем о начале генерации
-    await send_with_typing(
-        bot=message.bot,
-        chat_id=message.chat.id,
-        text=f"Супер! **{format_formatted}** ✨\n\nСейчас подумаю и предложу тебе **5 крутых идей** для контента! 🤔",
-        parse_mode="Markdown",
-        typing_duration=2,
-        reply_markup=get_main_keyboard()
-    )
+    ctx = await ContentContext.load(state)
     
     # Переходим к генерации идей
     await state.set_state(ContentGenerationStates.GENERATING_IDEAS)
     
     # Запускаем генерацию (используем оригинальный текст для AI)
-    await generate_and_show_ideas(message, state, niche, goal, format_original)
+    await generate_and_show_ideas(message, state, ctx.niche, ctx.goal, format_original)
+
 
+# Обработчики текстового ввода по состояниям FSM: голосовое сообщение после
+# распознавания передается тому же обработчику, что и текст (см. voice.py)
+TEXT_STATE_HANDLERS = {
+    ContentGenerationStates.COLLECTING_NICHE.state: handle_niche,
+    ContentGenerationStates.COLLECTING_GOAL.state: handle_goal,
+    ContentGenerationStates.COLLECTING_FORMAT.state: handle_format,
+}
 
-async def generate_and_show_ideas(message: Message, state: FSMContext, niche: str, goal: str, format_type: str):
-    """Генерация и отображение идей"""
+
+async def generate_and_show_ideas(
+    message: Message,
+    state: FSMContext,
+    niche: str,
+    goal: str,
+    format_type: str,
+    use_cache: bool = True
+):
+    """Генерация и отображение идей (use_cache=False - только новые идеи, без кэша)"""
     chat_id = message.chat.id
     bot = message.bot
     
     try:
-        # Показываем процесс
-        await send_typing_action(bot, chat_id, duration=3)
-        await message.answer("⏳ Генерирую идеи...")
+        # Идеи появляются в сообщении по мере генерации, индикатор печати - все время ожидания
+        ideas, ideas_message = await run_with_typing(
+            bot, chat_id, stream_ideas_to_chat(message, niche, goal, format_type, use_cache)
+        )
         
-        # Генерируем идеи
-        ideas = await idea_generator.generate_ideas(
-            niche=niche,
-            goal=goal,
-            format_type=format_type
+        # Полные тексты идей храним отдельной записью и читаем только при выборе идеи,
+        # чтобы не гонять их через хранилище при каждом обращении к данным диалога.
+        # Ключи - строки, чтобы не меняться при JSON-сериализации хранилища
+        await state.storage.set_data(
+            get_storage_key(state, IDEAS_DESTINY),
+            {str(idea["id"]): idea for idea in ideas}
         )
         
-        # Сохраняем идеи
-        await state.update_data(ideas=ideas)
+        # Пока пользователь читает идеи, начинаем писать пост по первой из них
+        if ideas and post_generator.settings.prewarm_post:
+            _prewarm_post(chat_id, niche, goal, format_type, ideas[0])
         
-        # Форматируем и отправляем
+        # Итоговый список идей с кнопками выбора
         ideas_text = format_ideas_message(ideas)
-        
-        # Показываем typing indicator
-        await send_typing_action(bot, chat_id, duration=2)
-        
-        # Отправляем идеи с кнопками
-        ideas_message = await bot.send_message(
-            chat_id=chat_id,
-            text=ideas_text,
-            reply_markup=get_ideas_keyboard(len(ideas)),
-            parse_mode="Markdown"
-        )
+        ideas_keyboard = get_ideas_keyboard(len(ideas))
+        edited = False
+        if ideas_message is not None:
+            try:
+                await ideas_message.edit_text(ideas_text, reply_markup=ideas_keyboard, parse_mode="Markdown")
+                edited = True
+            except Exception as e:
+                logger.warning(f"Не удалось обновить сообщение с идеями, отправляем новое: {e}")
+        if not edited:
+            ideas_message = await bot.send_message(
+                chat_id=chat_id,
+                text=ideas_text,
+                reply_markup=ideas_keyboard,
+                parse_mode="Markdown"
+            )
         
         # Сохраняем message_id для последующего удаления кнопок
         await state.update_data(last_buttons_message_id=ideas_message.message_id)
@@ -409,6 +548,197 @@ async def generate_and_show_ideas(message: Message, state: FSMContext, niche: st
         await state.set_state(ContentGenerationStates.COLLECTING_FORMAT)
 
 
+def _prewarm_post(chat_id: int, niche: str, goal: str, format_type: str, idea: Dict) -> None:
+    """
+    Запустить генерацию поста для идеи в фоне, пока пользователь выбирает
+    
+    Предыдущая заранее запущенная генерация для этого чата отменяется.
+    """
+    cancel_prewarmed_post(chat_id)
+    _prune_prewarmed_posts()
+    
+    task = asyncio.create_task(post_generator.generate_post_text(
+        niche=niche,
+        goal=goal,
+        format_type=format_type,
+        idea=idea
+    ))
+    # Ошибка будет обработана при выборе идеи; если результат не понадобится,
+    # забираем исключение, чтобы asyncio не ругался на необработанную ошибку
+    task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    _prewarmed_posts[chat_id] = (str(idea["id"]), task, time.monotonic())
+
+
+def cancel_prewarmed_post(chat_id: int) -> None:
+    """Отменить заранее запущенную генерацию поста для чата (при сбросе диалога)"""
+    prewarmed = _prewarmed_posts.pop(chat_id, None)
+    if prewarmed is not None:
+        prewarmed[1].cancel()
+
+
+def _prune_prewarmed_posts() -> None:
+    """Удалить устаревшие записи и самые старые сверх лимита (брошенные диалоги)"""
+    expired_before = time.monotonic() - _PREWARMED_POST_TTL
+    # Словарь упорядочен по времени добавления: самые старые записи - первые
+    excess = len(_prewarmed_posts) - _MAX_PREWARMED_POSTS + 1
+    for chat_id, (_, task, started_at) in list(_prewarmed_posts.items()):
+        if started_at >= expired_before and excess <= 0:
+            break
+        del _prewarmed_posts[chat_id]
+        task.cancel()
+        excess -= 1
+
+
+def _take_prewarmed_post(chat_id: int, idea: Dict) -> Optional[asyncio.Task]:
+    """
+    Забрать заранее запущенную генерацию поста, если она для выбранной идеи
+    
+    Returns:
+        Задача генерации (возможно, еще не завершенная) или None
+    """
+    prewarmed = _prewarmed_posts.pop(chat_id, None)
+    if prewarmed is None:
+        return None
+    
+    idea_id, task, started_at = prewarmed
+    if idea_id != str(idea["id"]) or time.monotonic() - started_at > _PREWARMED_POST_TTL:
+        task.cancel()
+        return None
+    
+    return task
+
+
+def _prewarmed_result(task: Optional[asyncio.Task]) -> Optional[Dict]:
+    """Результат заранее запущенной генерации, если она уже успешно завершилась"""
+    if task is None or not task.done() or task.cancelled() or task.exception() is not None:
+        return None
+    return task.result()
+
+
+async def _await_post_text(task: Optional[asyncio.Task], ctx: ContentContext, idea: Dict) -> Dict:
+    """
+    Текст поста: результат заранее запущенной генерации или новая генерация,
+    если заранее запущенной нет или она не удалась
+    """
+    if task is not None:
+        try:
+            post_data = await task
+            logger.info(f"Используем заранее сгенерированный пост | Idea ID: {idea['id']}")
+            return post_data
+        except Exception as e:
+            logger.warning(f"Заранее запущенная генерация поста не удалась, генерируем заново: {e}")
+    
+    return await post_generator.generate_post_text(
+        niche=ctx.niche,
+        goal=ctx.goal,
+        format_type=ctx.format_type,
+        idea=idea
+    )
+
+
+async def _await_placeholder(placeholder_task: asyncio.Task) -> Optional[Message]:
+    """Дождаться отправки сообщения-заглушки (None, если отправить не удалось)"""
+    try:
+        return await placeholder_task
+    except Exception as e:
+        logger.warning(f"Не удалось отправить сообщение о генерации идей: {e}")
+        return None
+
+
+async def stream_ideas_to_chat(
+    message: Message,
+    niche: str,
+    goal: str,
+    format_type: str,
+    use_cache: bool = True
+) -> Tuple[List[Dict], Optional[Message]]:
+    """
+    Сгенерировать идеи, показывая их в чате по мере готовности
+    
+    Сообщение-заглушка отправляется параллельно с запросом к AI и правится
+    не чаще раза в _IDEAS_EDIT_INTERVAL секунд. Если заглушку отправить
+    не удалось, идеи генерируются без промежуточного показа.
+    
+    Returns:
+        Кортеж (итоговый список идей, сообщение с идеями или None)
+    """
+    placeholder_task = asyncio.create_task(message.answer("⏳ Генерирую идеи..."))
+    
+    ideas: List[Dict] = []
+    last_edit_time = 0.0
+    show_progress = True
+    try:
+        async for ideas in idea_generator.stream_ideas(
+            niche=niche,
+            goal=goal,
+            format_type=format_type,
+            use_cache=use_cache
+        ):
+            # Полный список покажет вызывающий код вместе с кнопками
+            if not show_progress or len(ideas) >= 5 or time.monotonic() - last_edit_time < _IDEAS_EDIT_INTERVAL:
+                continue
+            
+            placeholder = await _await_placeholder(placeholder_task)
+            if placeholder is None:
+                show_progress = False
+                continue
+            
+            try:
+                await placeholder.edit_text(
+                    format_ideas_message(ideas, in_progress=True),
+                    parse_mode="Markdown"
+                )
+                last_edit_time = time.monotonic()
+            except Exception as e:
+                logger.warning(f"Не удалось обновить сообщение с идеями: {e}")
+    except Exception:
+        # Заглушка могла уже появиться в чате - убираем ее вместе с частью идей
+        placeholder = await _await_placeholder(placeholder_task) if show_progress else None
+        if placeholder is not None:
+            try:
+                await placeholder.delete()
+            except Exception as e:
+                logger.warning(f"Не удалось удалить сообщение о генерации идей: {e}")
+        raise
+    except BaseException:
+        placeholder_task.cancel()
+        raise
+    
+    placeholder = await _await_placeholder(placeholder_task) if show_progress else None
+    return ideas, placeholder
+
+
+def build_image_question(format_formatted: str) -> str:
+    """
+    Сформулировать вопрос об иллюстрации с форматом в дательном падеже
+    
+    "Пост для Instagram" → "Нужна иллюстрация к посту для instagram?"
+    
+    Args:
+        format_formatted: Переформулированный формат контента
+        
+    Returns:
+        Текст вопроса
+    """
+    format_lower = format_formatted.lower()
+    
+    for stem, dative in _DATIVE_FORMS:
+        if stem not in format_lower:
+            continue
+        
+        phrase = _DATIVE_PHRASE_RE.fullmatch(format_lower)
+        if phrase:
+            return f"Нужна иллюстрация к {_DATIVE_PHRASE_FORMS[phrase.group(1)]}{phrase.group(2)}?"
+        
+        # "Короткий пост", "Серия постов" - без уточнения формата
+        return f"Нужна иллюстрация к {dative}?"
+    
+    if _MAILING_RE.search(format_lower):
+        return "Нужна иллюстрация к рассылке?"
+    
+    return "Нужна иллюстрация для этого контента?"
+
+
 def should_offer_image(format_type: str) -> bool:
     """
     Определить, нужно ли предлагать иллюстрацию для данного формата
@@ -419,31 +749,9 @@ def should_offer_image(format_type: str) -> bool:
     Returns:
         True если формат предполагает публикацию с изображением
     """
-    format_lower = format_type.lower()
-    
-    # Форматы, которые обычно публикуются с изображением
-    with_image_keywords = [
-        "пост", "статья", "публикация", "заметка", "блог", 
-        "instagram", "facebook", "vk", "telegram", "соцсет"
-    ]
-    
-    # Форматы, которые не требуют изображения
-    without_image_keywords = [
-        "сценарий", "скрипт", "инструкция", "план", "текст",
-        "email", "письмо", "рассылка", "описание"
-    ]
-    
-    # Проверяем на наличие ключевых слов
-    for keyword in without_image_keywords:
-        if keyword in format_lower:
-            return False
-    
-    for keyword in with_image_keywords:
-        if keyword in format_lower:
-            return True
-    
-    # По умолчанию предлагаем изображение
-    return True
+    # Изображение предлагается по умолчанию (посты, статьи, соцсети),
+    # кроме форматов без визуальной части
+    return _WITHOUT_IMAGE_RE.search(format_type) is None
 
 
 @conversation_router.callback_query(ContentGenerationStates.WAITING_IDEA_CHOICE, F.data.startswith("idea_"))
@@ -463,14 +771,11 @@ async def handle_idea_choice(callback: CallbackQuery, state: FSMContext):
         logger.warning(f"Не удалось удалить кнопки: {e}")
     
     # Получаем выбранную идею
-    data = await state.get_data()
-    ideas = data.get("ideas", [])
-    
-    selected_idea = None
-    for idea in ideas:
-        if idea["id"] == idea_id:
-            selected_idea = idea
-            break
+    ctx, ideas_by_id = await asyncio.gather(
+        ContentContext.load(state),
+        state.storage.get_data(get_storage_key(state, IDEAS_DESTINY))
+    )
+    selected_idea = ideas_by_id.get(str(idea_id))
     
     if not selected_idea:
         await callback.message.answer("😔 Ошибка: идея не найдена. Попробуйте еще раз.")
@@ -487,33 +792,12 @@ async def handle_idea_choice(callback: CallbackQuery, state: FSMContext):
     )
     
     # Определяем, нужно ли предлагать иллюстрацию
-    format_type = data.get("format_type", "")
-    format_formatted = data.get("format_formatted", format_type)  # Используем красиво переформулированный
+    format_type = ctx.format_type or ""
+    format_formatted = ctx.format_formatted or format_type  # Используем красиво переформулированный
     
     if should_offer_image(format_type):
         # Спрашиваем нужна ли иллюстрация (используем красивую формулировку)
-        # Формируем правильный вопрос с правильным падежом
-        format_lower = format_formatted.lower()
-        
-        # Конвертируем формат в дательный падеж
-        if "пост" in format_lower and "для" in format_lower:
-            # "Пост для Instagram" → "посту для Instagram"
-            format_dative = format_formatted.replace("Пост", "посту").replace("пост", "посту")
-            question_text = f"Нужна иллюстрация к {format_dative.lower()}?"
-        elif "пост" in format_lower:
-            question_text = "Нужна иллюстрация к посту?"
-        elif "статья" in format_lower:
-            # "Статья для блога" → "статье для блога"
-            format_dative = format_formatted.replace("Статья", "статье").replace("статья", "статье")
-            question_text = f"Нужна иллюстрация к {format_dative.lower()}?"
-        elif "сценарий" in format_lower:
-            format_dative = format_formatted.replace("Сценарий", "сценарию").replace("сценарий", "сценарию")
-            question_text = f"Нужна иллюстрация к {format_dative.lower()}?"
-        elif "email" in format_lower or "письмо" in format_lower or "рассылка" in format_lower:
-            question_text = "Нужна иллюстрация к рассылке?"
-        else:
-            # По умолчанию
-            question_text = f"Нужна иллюстрация для этого контента?"
+        question_text = build_image_question(format_formatted)
         
         image_question = await callback.message.answer(
             question_text,
@@ -526,7 +810,6 @@ async def handle_idea_choice(callback: CallbackQuery, state: FSMContext):
         await state.set_state(ContentGenerationStates.ASKING_IMAGE)
     else:
         # Сразу генерируем без изображения
-        await state.update_data(need_image=False)
         await callback.message.answer(
             "Сейчас создам для тебя готовый текст...\n\n"
             "⏳ Это займет около 20-30 секунд",
@@ -535,10 +818,8 @@ async def handle_idea_choice(callback: CallbackQuery, state: FSMContext):
         
         # Переходим к генерации
         await state.set_state(ContentGenerationStates.GENERATING_POST)
-        niche = data.get("niche")
-        goal = data.get("goal")
         
-        await generate_and_send_post(callback.message, state, niche, goal, format_type, selected_idea)
+        await generate_and_send_post(callback.message, state, ctx, selected_idea, need_image=False)
 
 
 @conversation_router.callback_query(ContentGenerationStates.ASKING_IMAGE, F.data == "need_image_yes")
@@ -556,9 +837,6 @@ async def handle_image_yes(callback: CallbackQuery, state: FSMContext):
     except Exception as e:
         logger.warning(f"Не удалось удалить сообщение с вопросом: {e}")
     
-    # Сохраняем выбор
-    await state.update_data(need_image=True)
-    
     await callback.bot.send_message(
         chat_id=chat_id,
         text="Сейчас создам для тебя готовый пост с изображением...\n\n"
@@ -569,13 +847,8 @@ async def handle_image_yes(callback: CallbackQuery, state: FSMContext):
     # Переходим к генерации
     await state.set_state(ContentGenerationStates.GENERATING_POST)
     
-    data = await state.get_data()
-    niche = data.get("niche")
-    goal = data.get("goal")
-    format_type = data.get("format_type")
-    selected_idea = data.get("selected_idea")
-    
-    await generate_and_send_post(callback.message, state, niche, goal, format_type, selected_idea)
+    ctx = await ContentContext.load(state)
+    await generate_and_send_post(callback.message, state, ctx, ctx.selected_idea, need_image=True)
 
 
 @conversation_router.callback_query(ContentGenerationStates.ASKING_IMAGE, F.data == "need_image_no")
@@ -593,9 +866,6 @@ async def handle_image_no(callback: CallbackQuery, state: FSMContext):
     except Exception as e:
         logger.warning(f"Не удалось удалить сообщение с вопросом: {e}")
     
-    # Сохраняем выбор
-    await state.update_data(need_image=False)
-    
     await callback.bot.send_message(
         chat_id=chat_id,
         text="Сейчас создам для тебя готовый текст...\n\n"
@@ -606,13 +876,8 @@ async def handle_image_no(callback: CallbackQuery, state: FSMContext):
     # Переходим к генерации
     await state.set_state(ContentGenerationStates.GENERATING_POST)
     
-    data = await state.get_data()
-    niche = data.get("niche")
-    goal = data.get("goal")
-    format_type = data.get("format_type")
-    selected_idea = data.get("selected_idea")
-    
-    await generate_and_send_post(callback.message, state, niche, goal, format_type, selected_idea)
+    ctx = await ContentContext.load(state)
+    await generate_and_send_post(callback.message, state, ctx, ctx.selected_idea, need_image=False)
 
 
 @conversation_router.callback_query(ContentGenerationStates.WAITING_IDEA_CHOICE, F.data == "regenerate_ideas")
@@ -629,65 +894,99 @@ async def handle_regenerate_ideas(callback: CallbackQuery, state: FSMContext):
     except Exception as e:
         logger.warning(f"Не удалось удалить кнопки: {e}")
     
-    data = await state.get_data()
-    niche = data.get("niche")
-    goal = data.get("goal")
-    format_type = data.get("format_type")
+    ctx = await ContentContext.load(state)
     
     await callback.message.answer("Хорошо, генерирую другие идеи! 🔄", reply_markup=get_main_keyboard())
     
     await state.set_state(ContentGenerationStates.GENERATING_IDEAS)
-    await generate_and_show_ideas(callback.message, state, niche, goal, format_type)
+    # Пользователь просит другие идеи - кэш не используем
+    await generate_and_show_ideas(
+        callback.message, state, ctx.niche, ctx.goal, ctx.format_type, use_cache=False
+    )
+
+
+async def send_photo_with_retry(bot: Bot, chat_id: int, image_bytes: bytes) -> bool:
+    """
+    Отправить изображение с повторными попытками
+    
+    Между попытками экспоненциальная задержка с jitter; при флуд-контроле
+    Telegram (TelegramRetryAfter) ждем ровно указанное им время.
+    
+    Returns:
+        True если изображение отправлено
+    """
+    for attempt in range(_PHOTO_SEND_ATTEMPTS):
+        try:
+            photo = BufferedInputFile(image_bytes, filename="post_image.png")
+            await bot.send_photo(
+                chat_id=chat_id,
+                photo=photo,
+                request_timeout=30  # Увеличиваем таймаут для больших изображений
+            )
+            logger.info(f"✓ Изображение успешно отправлено (попытка {attempt + 1})")
+            return True
+        except Exception as e:
+            logger.warning(
+                f"Попытка {attempt + 1}/{_PHOTO_SEND_ATTEMPTS} отправки фото не удалась: {type(e).__name__}: {e}"
+            )
+            if attempt == _PHOTO_SEND_ATTEMPTS - 1:
+                break
+            
+            if isinstance(e, TelegramRetryAfter):
+                delay = e.retry_after
+            else:
+                delay = min(_PHOTO_RETRY_MAX_DELAY, _PHOTO_RETRY_BASE_DELAY * 2 ** attempt)
+                delay += random.uniform(0, _PHOTO_RETRY_JITTER)
+            await asyncio.sleep(delay)
+    
+    logger.error(f"✗ Не удалось отправить изображение после {_PHOTO_SEND_ATTEMPTS} попыток")
+    return False
 
 
-async def generate_and_send_post(message: Message, state: FSMContext, niche: str, goal: str, format_type: str, idea: dict):
-    """Генерация и отправка полного поста"""
+async def generate_and_send_post(
+    message: Message,
+    state: FSMContext,
+    ctx: ContentContext,
+    idea: dict,
+    need_image: bool
+):
+    """
+    Генерация и отправка полного поста
+    
+    Данные диалога передает вызывающий handler, который их уже загрузил,
+    чтобы не читать хранилище FSM повторно.
+    """
     chat_id = message.chat.id
     bot = message.bot
     user_id = message.from_user.id
     
-    # Получаем флаг нужна ли картинка
-    data = await state.get_data()
-    need_image = data.get("need_image", False)
-    
     try:
         # Показываем процесс
         await send_typing_action(bot, chat_id, duration=3)
         
+        # Текст поста мог быть сгенерирован заранее, пока пользователь выбирал идею
+        prewarmed_task = _take_prewarmed_post(chat_id, idea)
+        
         if need_image:
-            # Генерируем с изображением
+            # Генерируем с изображением. Если заранее запущенный текст еще не готов,
+            # изображение генерируется параллельно с ним, а не после него
+            prewarmed_post = _prewarmed_result(prewarmed_task)
             post_data, image_url, image_bytes = await post_generator.generate_complete_post(
-                niche=niche,
-                goal=goal,
-                format_type=format_type,
-                idea=idea
+                niche=ctx.niche,
+                goal=ctx.goal,
+                format_type=ctx.format_type,
+                idea=idea,
+                post_data=prewarmed_post,
+                post_text=(
+                    _await_post_text(prewarmed_task, ctx, idea)
+                    if prewarmed_post is None and prewarmed_task is not None else None
+                )
             )
             
             log_user_action(logger, user_id, "Пост с изображением сгенерирован")
             
             # Отправляем изображение (с retry механизмом)
-            photo_sent = False
-            max_retries = 3
-            
-            for attempt in range(max_retries):
-                try:
-                    photo = BufferedInputFile(image_bytes, filename="post_image.png")
-                    await bot.send_photo(
-                        chat_id=chat_id,
-                        photo=photo,
-                        request_timeout=30  # Увеличиваем таймаут для больших изображений
-                    )
-                    photo_sent = True
-                    logger.info(f"✓ Изображение успешно отправлено (попытка {attempt + 1})")
-                    break
-                except Exception as e:
-                    logger.warning(
-                        f"Попытка {attempt + 1}/{max_retries} отправки фото не удалась: {type(e).__name__}: {e}"
-                    )
-                    if attempt < max_retries - 1:
-                        await asyncio.sleep(2)  # Пауза перед повторной попыткой
-                    else:
-                        logger.error(f"✗ Не удалось отправить изображение после {max_retries} попыток")
+            photo_sent = await send_photo_with_retry(bot, chat_id, image_bytes)
             
             # Отправляем текст поста
             post_text = format_post_with_hashtags(post_data)
@@ -699,37 +998,23 @@ async def generate_and_send_post(message: Message, state: FSMContext, niche: str
                     "_Но вот твой готовый текст поста:_\n\n"
                 )
                 post_text = warning_text + post_text
-            
-            await send_with_typing(
-                bot=bot,
-                chat_id=chat_id,
-                text=f"{'━' * 30}\n\n{post_text}\n\n{'━' * 30}",
-                parse_mode="Markdown",
-                reply_markup=get_main_keyboard(),
-                typing_duration=2
-            )
         else:
             # Генерируем только текст
-            post_data = await post_generator.generate_post_text(
-                niche=niche,
-                goal=goal,
-                format_type=format_type,
-                idea=idea
-            )
+            post_data = await _await_post_text(prewarmed_task, ctx, idea)
             
             log_user_action(logger, user_id, "Текст поста сгенерирован")
             
-            # Отправляем только текст
             post_text = format_post_with_hashtags(post_data)
-            
-            await send_with_typing(
-                bot=bot,
-                chat_id=chat_id,
-                text=f"{'━' * 30}\n\n{post_text}\n\n{'━' * 30}",
-                parse_mode="Markdown",
-                reply_markup=get_main_keyboard(),
-                typing_duration=2
-            )
+        
+        # Отправляем текст поста между разделителями
+        await send_with_typing(
+            bot=bot,
+            chat_id=chat_id,
+            text=f"{_POST_SEPARATOR}\n\n{post_text}\n\n{_POST_SEPARATOR}",
+            parse_mode="Markdown",
+            reply_markup=get_main_keyboard(),
+            typing_duration=2
+        )
         
         # Финальное сообщение
         continue_message = await message.answer(
@@ -738,8 +1023,12 @@ async def generate_and_send_post(message: Message, state: FSMContext, niche: str
             reply_markup=get_continue_keyboard()
         )
         
-        # Сохраняем message_id для последующего удаления кнопок
-        await state.update_data(last_buttons_message_id=continue_message.message_id)
+        # Пост отправлен - идеи больше не нужны. Сохраняем message_id
+        # для последующего удаления кнопок
+        await asyncio.gather(
+            clear_ideas(state),
+            state.update_data(last_buttons_message_id=continue_message.message_id)
+        )
         
         # Переходим в состояние завершения
         await state.set_state(ContentGenerationStates.COMPLETED)
@@ -772,7 +1061,8 @@ async def handle_create_new(callback: CallbackQuery, state: FSMContext):
         logger.warning(f"Не удалось удалить кнопки: {e}")
     
     # Очищаем состояние
-    await state.clear()
+    cancel_prewarmed_post(callback.message.chat.id)
+    await clear_dialog(state)
     
     # Перезапускаем процесс
     await callback.message.answer(
@@ -809,5 +1099,6 @@ async def handle_finish(callback: CallbackQuery, state: FSMContext):
         reply_markup=get_main_keyboard()
     )
     
-    await state.clear()
+    cancel_prewarmed_post(callback.message.chat.id)
+    await clear_dialog(state)
 
@@ -12,18 +12,29 @@ from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
 from core.logger import get_logger, log_user_action
-from bot.states import ContentGenerationStates
+from bot.states import ContentGenerationStates, SESSION_DESTINY, clear_dialog, get_storage_key
 from bot.utils import send_with_typing
 from bot.keyboards import get_main_keyboard
+from bot.handlers.conversation import cancel_prewarmed_post
 
 logger = get_logger(__name__)
 
 # Создаем router для этого handler
 start_router = Router()
 
-# Хранилище данных о пользователях (в памяти)
-# Структура: {user_id: {"last_interaction": datetime, "session_count": int}}
-user_sessions = {}
+# Данные о сессиях пользователей хранятся в хранилище FSM (память или Redis)
+# под отдельным destiny SESSION_DESTINY.
+# Структура: {"last_interaction": ISO-строка, "session_count": int}
+
+# Короткие приветствия для тех, кто недавно общался с ботом (выбираются случайно)
+_SHORT_GREETING_TEMPLATES = (
+    "Продолжим, {name}! 🚀\n\n**Какая ниша?**",
+    "Окей, {name}! 👌\n\n**Новый пост? Какая ниша?**",
+    "Го дальше! ⚡\n\n**Какая ниша?**",
+    "Ещё один пост? 💪\n\n**Ниша?**",
+    "Создаём! 🎯\n\n**Какая ниша?**",
+    "Поехали, {name}! 🔥\n\n**Ниша?**",
+)
 
 
 @start_router.message(F.text == "✨ Новый диалог")
@@ -78,21 +89,23 @@ async def cmd_start(message: Message, state: FSMContext):
         except Exception as e:
             logger.warning(f"Не удалось удалить старые кнопки: {e}")
     
-    # Очищаем предыдущее состояние FSM
-    await state.clear()
+    # Очищаем предыдущее состояние FSM и фоновую генерацию поста прошлого диалога
+    cancel_prewarmed_post(message.chat.id)
+    await clear_dialog(state)
     
-    # Проверяем данные пользователя из глобального хранилища
+    # Проверяем данные пользователя из хранилища сессий
     now = datetime.now()
-    user_data = user_sessions.get(user_id)
+    session_key = get_storage_key(state, SESSION_DESTINY)
+    user_data = await state.storage.get_data(session_key)
     
     # Определяем тип приветствия
-    if user_data is None:
+    if not user_data:
         # Совсем новый пользователь - полное приветствие
         greeting_type = "first_time"
         session_count = 1
     else:
         # Пользователь уже был
-        last_interaction = user_data.get("last_interaction")
+        last_interaction = datetime.fromisoformat(user_data["last_interaction"])
         session_count = user_data.get("session_count", 0) + 1
         
         # Проверяем, прошло ли более 12 часов
@@ -105,10 +118,10 @@ async def cmd_start(message: Message, state: FSMContext):
             greeting_type = "continue"
     
     # Обновляем данные пользователя
-    user_sessions[user_id] = {
-        "last_interaction": now,
+    await state.storage.set_data(session_key, {
+        "last_interaction": now.isoformat(),
         "session_count": session_count
-    }
+    })
     
     # Формируем приветствие в зависимости от типа
     if greeting_type == "first_time":
@@ -150,16 +163,7 @@ async def cmd_start(message: Message, state: FSMContext):
     
     else:  # greeting_type == "continue"
         # Только что общались - очень короткое приветствие (варианты)
-        short_greetings = [
-            f"Продолжим, {first_name}! 🚀\n\n**Какая ниша?**",
-            f"Окей, {first_name}! 👌\n\n**Новый пост? Какая ниша?**",
-            f"Го дальше! ⚡\n\n**Какая ниша?**",
-            f"Ещё один пост? 💪\n\n**Ниша?**",
-            f"Создаём! 🎯\n\n**Какая ниша?**",
-            f"Поехали, {first_name}! 🔥\n\n**Ниша?**"
-        ]
-        
-        base_greeting = random.choice(short_greetings)
+        base_greeting = random.choice(_SHORT_GREETING_TEMPLATES).format(name=first_name)
         welcome_text = f"""{base_greeting}
 
 Например: фитнес, бизнес, образование, психология, кулинария и т.д.
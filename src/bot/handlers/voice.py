@@ -4,17 +4,18 @@ Handler для голосовых сообщений
 Обрабатывает голосовые сообщения, транскрибирует их и обрабатывает как текст.
 """
 
-import os
-from pathlib import Path
+import asyncio
 from aiogram import Router, F
 from aiogram.types import Message
 from aiogram.fsm.context import FSMContext
 
+from core.cache import LRUCache
 from core.logger import get_logger, log_user_action, log_exception
 from core.exceptions import TranscriptionError
 from api.proxyapi_client import ProxyAPIClient
-from bot.utils import send_typing_action
+from bot.utils import run_with_typing
 from bot.keyboards import get_main_keyboard
+from bot.handlers.conversation import TEXT_STATE_HANDLERS
 
 logger = get_logger(__name__)
 
@@ -24,6 +25,14 @@ voice_router = Router()
 # Глобальная ссылка на API клиент (будет установлена в main.py)
 api_client: ProxyAPIClient = None
 
+# Кэш распознанных голосовых: file_unique_id -> текст.
+# Пересланное или повторно отправленное голосовое не скачивается и не распознается заново
+_transcription_cache = LRUCache(maxsize=512)
+
+# Ограничение одновременных скачиваний голосовых: при всплеске сообщений
+# загрузки не забирают весь пул соединений с Telegram у отправки ответов
+_download_semaphore = asyncio.Semaphore(8)
+
 
 def setup_api_client(client: ProxyAPIClient):
     """Установить API клиент для handler"""
@@ -31,6 +40,44 @@ def setup_api_client(client: ProxyAPIClient):
     api_client = client
 
 
+async def transcribe_voice(message: Message) -> str:
+    """
+    Распознать голосовое сообщение (с кэшем по file_unique_id)
+    
+    Args:
+        message: Сообщение с голосовым
+        
+    Returns:
+        Распознанный текст
+        
+    Raises:
+        TranscriptionError: При ошибках транскрибации
+    """
+    user_id = message.from_user.id
+    voice = message.voice
+    
+    transcribed_text = _transcription_cache.get(voice.file_unique_id)
+    if transcribed_text is not None:
+        logger.info(f"Голосовое найдено в кэше транскрибаций | User {user_id}")
+        return transcribed_text
+    
+    # Скачиваем голосовое в память (BytesIO) - без временных файлов на диске
+    async with _download_semaphore:
+        audio = await message.bot.download(voice)
+    
+    logger.info(f"Голосовое сообщение скачано | User {user_id} | Размер: {voice.file_size} байт")
+    
+    # Транскрибируем
+    transcribed_text = await api_client.transcribe_audio(
+        audio_file=audio,
+        filename="voice.ogg",
+        language="ru"
+    )
+    _transcription_cache.set(voice.file_unique_id, transcribed_text)
+    
+    return transcribed_text
+
+
 @voice_router.message(F.voice)
 async def handle_voice(message: Message, state: FSMContext):
     """
@@ -45,39 +92,8 @@ async def handle_voice(message: Message, state: FSMContext):
     log_user_action(logger, user_id, "Получено голосовое сообщение")
     
     try:
-        # Показываем typing indicator пока обрабатываем
-        await send_typing_action(message.bot, message.chat.id, duration=2)
-        
-        # Получаем информацию о голосовом сообщении
-        voice = message.voice
-        file_id = voice.file_id
-        
-        # Скачиваем файл
-        file = await message.bot.get_file(file_id)
-        
-        # Создаем временную папку если не существует
-        temp_dir = Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        
-        # Путь для сохранения
-        temp_file_path = temp_dir / f"voice_{user_id}_{message.message_id}.ogg"
-        
-        # Скачиваем файл
-        await message.bot.download_file(file.file_path, destination=temp_file_path)
-        
-        logger.info(f"Голосовое сообщение скачано: {temp_file_path}")
-        
-        # Транскрибируем
-        transcribed_text = await api_client.transcribe_audio(
-            audio_file_path=temp_file_path,
-            language="ru"
-        )
-        
-        # Удаляем временный файл
-        try:
-            os.remove(temp_file_path)
-        except Exception as e:
-            logger.warning(f"Не удалось удалить временный файл: {e}")
+        # Индикатор печати показываем, пока идет распознавание, без фиксированной задержки
+        transcribed_text = await run_with_typing(message.bot, message.chat.id, transcribe_voice(message))
         
         logger.info(f"Голосовое транскрибировано | User {user_id} | Текст: {transcribed_text[:100]}")
         
@@ -95,21 +111,10 @@ async def handle_voice(message: Message, state: FSMContext):
         # Находим текущее состояние и обрабатываем соответственно
         current_state = await state.get_state()
         
-        # Импортируем handlers здесь чтобы избежать циклической зависимости
-        from bot.handlers.conversation import (
-            handle_niche,
-            handle_goal,
-            handle_format
-        )
-        from bot.states import ContentGenerationStates
-        
         # Вызываем соответствующий handler в зависимости от состояния
-        if current_state == ContentGenerationStates.COLLECTING_NICHE.state:
-            await handle_niche(text_message, state)
-        elif current_state == ContentGenerationStates.COLLECTING_GOAL.state:
-            await handle_goal(text_message, state)
-        elif current_state == ContentGenerationStates.COLLECTING_FORMAT.state:
-            await handle_format(text_message, state)
+        handler = TEXT_STATE_HANDLERS.get(current_state)
+        if handler is not None:
+            await handler(text_message, state)
         else:
             # Для других состояний просто показываем текст
             await message.answer(
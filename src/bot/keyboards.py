@@ -2,12 +2,17 @@
 Клавиатуры для Telegram бота
 
 Создает интерактивные кнопки для удобного взаимодействия с пользователем.
+
+Клавиатуры не меняются за время работы бота, поэтому каждая строится один раз
+и дальше переиспользуется (lru_cache) - без повторной валидации моделей aiogram.
 """
 
+from functools import lru_cache
 from typing import List
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton, ReplyKeyboardMarkup, KeyboardButton
 
 
+@lru_cache(maxsize=16)
 def get_ideas_keyboard(num_ideas: int = 5) -> InlineKeyboardMarkup:
     """
     Клавиатура для выбора идеи (полупрозрачные кнопки)
@@ -53,6 +58,7 @@ def get_ideas_keyboard(num_ideas: int = 5) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def get_continue_keyboard() -> InlineKeyboardMarkup:
     """
     Клавиатура для продолжения или завершения
@@ -80,6 +86,7 @@ def get_continue_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def get_yes_no_keyboard() -> InlineKeyboardMarkup:
     """
     Клавиатура Да/Нет для вопроса об иллюстрации
@@ -103,6 +110,7 @@ def get_yes_no_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def get_cancel_keyboard() -> InlineKeyboardMarkup:
     """
     Клавиатура с кнопкой отмены
@@ -124,6 +132,7 @@ def get_cancel_keyboard() -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=buttons)
 
 
+@lru_cache(maxsize=None)
 def get_main_keyboard() -> ReplyKeyboardMarkup:
     """
     Главная клавиатура с постоянной кнопкой внизу чата
@@ -0,0 +1,84 @@
+"""
+Middleware для исходящих запросов к Telegram Bot API
+
+Telegram ограничивает частоту отправки: около 30 сообщений в секунду
+на бота и около 1 сообщения в секунду в один чат. При всплеске нажатий
+кнопок запросы без ограничения упираются в 429 и таймауты пула соединений,
+поэтому они выстраиваются в очередь и уходят с допустимой скоростью.
+"""
+
+from typing import TYPE_CHECKING, Any
+
+from aiogram.client.session.middlewares.base import (
+    BaseRequestMiddleware,
+    NextRequestMiddlewareType,
+)
+from aiogram.methods import GetUpdates, SendChatAction, TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+
+from core.cache import LRUCache
+from core.rate_limiter import AsyncRateLimiter
+
+if TYPE_CHECKING:
+    from aiogram import Bot
+
+# Кратковременный всплеск сообщений в один чат (например, текст поста и картинка подряд)
+CHAT_BURST = 3
+
+# Сколько чатов хранить с собственным лимитером (давно неактивные вытесняются)
+MAX_TRACKED_CHATS = 10000
+
+# Лимит чата касается только методов, которые отправляют или правят сообщения
+# (sendMessage, sendPhoto, editMessageText, ...). Остальные запросы с chat_id
+# (индикатор печати, ответы на нажатия кнопок) не занимают его и не задерживают отправку
+CHAT_LIMITED_PREFIXES = ("send", "edit", "copy", "forward")
+
+
+class RateLimitMiddleware(BaseRequestMiddleware):
+    """
+    Ограничение частоты исходящих запросов: общее на бота и отдельное на каждый чат
+
+    getUpdates не ограничивается, чтобы очередь отправки не задерживала
+    получение новых сообщений. Лимит чата применяется только к отправке
+    и правке сообщений (CHAT_LIMITED_PREFIXES), sendChatAction его не занимает.
+    """
+
+    def __init__(self, global_rate: float = 29, chat_rate: float = 1.0):
+        """
+        Args:
+            global_rate: Максимум запросов в секунду на бота
+            chat_rate: Максимум запросов в секунду в один чат (в среднем)
+        """
+        self.chat_rate = chat_rate
+        self._global_limiter = AsyncRateLimiter(global_rate)
+        self._chat_limiters = LRUCache(maxsize=MAX_TRACKED_CHATS)
+
+    def _get_chat_limiter(self, chat_id: Any) -> AsyncRateLimiter:
+        limiter = self._chat_limiters.get(chat_id)
+        if limiter is None:
+            limiter = AsyncRateLimiter(self.chat_rate, burst=CHAT_BURST)
+            self._chat_limiters.set(chat_id, limiter)
+        return limiter
+
+    @staticmethod
+    def _is_chat_limited(method: TelegramMethod[Any]) -> bool:
+        if isinstance(method, SendChatAction):
+            return False
+        return method.__api_method__.startswith(CHAT_LIMITED_PREFIXES)
+
+    async def __call__(
+        self,
+        make_request: NextRequestMiddlewareType[TelegramType],
+        bot: "Bot",
+        method: TelegramMethod[TelegramType],
+    ) -> Response[TelegramType]:
+        if isinstance(method, GetUpdates):
+            return await make_request(bot, method)
+
+        # Сначала лимит чата: пока запрос ждет свой чат, он не занимает общий лимит
+        chat_id = getattr(method, "chat_id", None)
+        if chat_id is not None and self._is_chat_limited(method):
+            await self._get_chat_limiter(chat_id).acquire()
+
+        await self._global_limiter.acquire()
+        return await make_request(bot, method)
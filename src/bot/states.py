@@ -4,7 +4,13 @@ FSM состояния для управления диалогом
 Определяет все возможные состояния разговора пользователя с ботом.
 """
 
+import asyncio
+from dataclasses import dataclass, fields, replace
+from typing import Dict, Optional, Union
+
+from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
+from aiogram.fsm.storage.base import StorageKey
 
 
 class ContentGenerationStates(StatesGroup):
@@ -36,50 +42,140 @@ class ContentGenerationStates(StatesGroup):
     COMPLETED = State()             # Пост готов, предложение продолжить
 
 
+@dataclass(slots=True)
+class ContentContext:
+    """
+    Данные диалога, собранные в FSM
+    
+    Загружается одним вызовом get_data вместо набора data.get(...) в каждом handler.
+    """
+    
+    niche: Optional[str] = None
+    goal: Optional[str] = None
+    format_type: Optional[str] = None
+    format_formatted: Optional[str] = None
+    selected_idea: Optional[Dict] = None
+    
+    @classmethod
+    async def load(cls, state: FSMContext) -> "ContentContext":
+        """
+        Загрузить данные диалога из FSM
+        
+        Args:
+            state: FSM контекст
+            
+        Returns:
+            Данные диалога (отсутствующие поля - значения по умолчанию)
+        """
+        data = await state.get_data()
+        return cls(**{f.name: data[f.name] for f in fields(cls) if f.name in data})
+
+
+# Отдельные записи хранилища FSM рядом с основными данными диалога.
+# state.clear() их не затрагивает (идеи удаляются вместе с диалогом, см. clear_dialog)
+SESSION_DESTINY = "session"  # Данные о сессиях пользователя (приветствия)
+IDEAS_DESTINY = "ideas"      # Полные тексты последних сгенерированных идей
+
+
+def get_storage_key(state: FSMContext, destiny: str) -> StorageKey:
+    """
+    Ключ отдельной записи хранилища для того же пользователя и чата
+    
+    Args:
+        state: FSM контекст
+        destiny: Назначение записи (SESSION_DESTINY, IDEAS_DESTINY)
+        
+    Returns:
+        Ключ хранилища
+    """
+    return replace(state.key, destiny=destiny)
+
+
+async def clear_ideas(state: FSMContext) -> None:
+    """
+    Удалить сохраненные идеи пользователя
+    
+    Пустые данные хранилище не держит (Redis удаляет ключ), поэтому запись
+    не копится после завершения диалога, а кнопки идей из прошлых диалогов
+    перестают работать.
+    
+    Args:
+        state: FSM контекст
+    """
+    await state.storage.set_data(get_storage_key(state, IDEAS_DESTINY), {})
+
+
+async def clear_dialog(state: FSMContext) -> None:
+    """
+    Сбросить диалог: состояние FSM, его данные и сохраненные идеи
+    
+    Данные сессии (SESSION_DESTINY) сохраняются.
+    
+    Args:
+        state: FSM контекст
+    """
+    await asyncio.gather(state.clear(), clear_ideas(state))
+
+
+# Состояния по имени: короткому ("COLLECTING_NICHE") и полному, как его
+# возвращает FSMContext.get_state() ("ContentGenerationStates:COLLECTING_NICHE")
+_STATES_BY_NAME: Dict[str, State] = {
+    name: state
+    for state in ContentGenerationStates.__all_states__
+    for name in (state.state, state.state.split(":", 1)[-1])
+}
+
+
+def _resolve_state(state: Union[State, str, None]) -> Optional[State]:
+    """Привести состояние (объект или имя) к объекту State"""
+    if isinstance(state, State):
+        return state
+    return _STATES_BY_NAME.get(state)
+
+
 # Описания состояний для логирования и отладки
 STATE_DESCRIPTIONS = {
-    "INITIAL": "Начало диалога",
-    "COLLECTING_NICHE": "Сбор информации о нише",
-    "COLLECTING_GOAL": "Сбор информации о цели",
-    "COLLECTING_FORMAT": "Сбор информации о формате",
-    "GENERATING_IDEAS": "Генерация идей",
-    "WAITING_IDEA_CHOICE": "Ожидание выбора идеи",
-    "ASKING_IMAGE": "Вопрос о необходимости иллюстрации",
-    "GENERATING_POST": "Генерация поста",
-    "COMPLETED": "Завершение, пост готов"
+    ContentGenerationStates.INITIAL: "Начало диалога",
+    ContentGenerationStates.COLLECTING_NICHE: "Сбор информации о нише",
+    ContentGenerationStates.COLLECTING_GOAL: "Сбор информации о цели",
+    ContentGenerationStates.COLLECTING_FORMAT: "Сбор информации о формате",
+    ContentGenerationStates.GENERATING_IDEAS: "Генерация идей",
+    ContentGenerationStates.WAITING_IDEA_CHOICE: "Ожидание выбора идеи",
+    ContentGenerationStates.ASKING_IMAGE: "Вопрос о необходимости иллюстрации",
+    ContentGenerationStates.GENERATING_POST: "Генерация поста",
+    ContentGenerationStates.COMPLETED: "Завершение, пост готов"
 }
 
 
-def get_state_description(state: str) -> str:
+def get_state_description(state: Union[State, str, None]) -> str:
     """
     Получить описание состояния
     
     Args:
-        state: Название состояния
+        state: Состояние или его название (короткое или полное)
         
     Returns:
         Описание состояния
     """
-    return STATE_DESCRIPTIONS.get(state, "Неизвестное состояние")
+    return STATE_DESCRIPTIONS.get(_resolve_state(state), "Неизвестное состояние")
 
 
 # Вопросы бота для каждого состояния (используются в модерации)
 STATE_QUESTIONS = {
-    "COLLECTING_NICHE": "Какая у тебя ниша или тематика контента?",
-    "COLLECTING_GOAL": "Какая главная цель твоего контента?",
-    "COLLECTING_FORMAT": "В каком формате ты хочешь создать контент?"
+    ContentGenerationStates.COLLECTING_NICHE: "Какая у тебя ниша или тематика контента?",
+    ContentGenerationStates.COLLECTING_GOAL: "Какая главная цель твоего контента?",
+    ContentGenerationStates.COLLECTING_FORMAT: "В каком формате ты хочешь создать контент?"
 }
 
 
-def get_state_question(state: str) -> str:
+def get_state_question(state: Union[State, str, None]) -> str:
     """
     Получить вопрос для состояния
     
     Args:
-        state: Название состояния
+        state: Состояние или его название (короткое или полное)
         
     Returns:
         Вопрос, который задает бот в этом состоянии
     """
-    return STATE_QUESTIONS.get(state, "")
-
+    return STATE_QUESTIONS.get(_resolve_state(state), "")
@@ -8,7 +8,8 @@
 """
 
 import asyncio
-from typing import Optional
+import re
+from typing import Awaitable, Optional, TypeVar
 from aiogram import Bot
 from aiogram.enums import ChatAction
 
@@ -16,6 +17,21 @@ from core.logger import get_logger
 
 logger = get_logger(__name__)
 
+T = TypeVar("T")
+
+# Telegram показывает индикатор печати около 5 секунд - обновляем чаще
+TYPING_REFRESH_INTERVAL = 4.0
+
+# Символы, которые нужно экранировать в Markdown V2: символ -> \символ.
+# str.translate экранирует все за один проход вместо replace на каждый символ
+_MARKDOWN_ESCAPE_TABLE = str.maketrans({char: f"\\{char}" for char in "_*[]()~`>#+-=|{}.!"})
+
+# Хештег в тексте поста: #слово (буквы, цифры, подчеркивание)
+_HASHTAG_RE = re.compile(r"#(\w+)")
+
+# Разделитель между идеями в сообщении со списком идей
+_IDEAS_SEPARATOR = "━━━━━━━━━━━━━━━━"
+
 
 async def send_typing_action(
     bot: Bot,
@@ -39,6 +55,45 @@ async def send_typing_action(
         logger.warning(f"Не удалось отправить typing action: {e}")
 
 
+async def keep_typing(bot: Bot, chat_id: int, interval: float = TYPING_REFRESH_INTERVAL) -> None:
+    """
+    Показывать индикатор печати, пока задачу не отменят
+    
+    Args:
+        bot: Экземпляр бота
+        chat_id: ID чата
+        interval: Период обновления индикатора в секундах
+    """
+    while True:
+        try:
+            await bot.send_chat_action(chat_id=chat_id, action=ChatAction.TYPING)
+        except Exception as e:
+            logger.warning(f"Не удалось отправить typing action: {e}")
+        await asyncio.sleep(interval)
+
+
+async def run_with_typing(bot: Bot, chat_id: int, awaitable: Awaitable[T]) -> T:
+    """
+    Дождаться результата, показывая индикатор печати все время ожидания
+    
+    В отличие от send_typing_action не добавляет фиксированной задержки:
+    индикатор снимается сразу, как только результат готов.
+    
+    Args:
+        bot: Экземпляр бота
+        chat_id: ID чата
+        awaitable: Корутина или задача, результат которой ждем
+        
+    Returns:
+        Результат awaitable
+    """
+    typing_task = asyncio.create_task(keep_typing(bot, chat_id))
+    try:
+        return await awaitable
+    finally:
+        typing_task.cancel()
+
+
 def calculate_delay(text_length: int, min_delay: float = 0.5, max_delay: float = 3.0, per_char: float = 0.01) -> float:
     """
     Рассчитать задержку перед ответом
@@ -87,34 +142,41 @@ async def send_with_typing(
     await bot.send_message(chat_id=chat_id, text=text, **kwargs)
 
 
-def format_ideas_message(ideas: list) -> str:
+def _format_idea_block(idea: dict) -> str:
+    """Блок одной идеи: разделитель, заголовок, описание и ключевые элементы"""
+    block = f"{_IDEAS_SEPARATOR}\n💡 **Идея {idea['id']}: \"{idea['title']}\"**\n\n{idea['description']}\n"
+    
+    # Ключевые элементы если есть
+    if idea.get('key_elements'):
+        elements = "\n".join(f"• {element}" for element in idea['key_elements'])
+        block += f"\n**Ключевые элементы:**\n{elements}\n"
+    
+    return block
+
+
+def format_ideas_message(ideas: list, in_progress: bool = False) -> str:
     """
     Форматировать список идей для отображения
     
     Args:
         ideas: Список идей в формате [{id, title, description, key_elements}]
+        in_progress: Идеи еще генерируются (вместо вопроса - строка о процессе)
         
     Returns:
         Красиво отформатированное сообщение
     """
-    message_parts = ["Вот 5 идей для твоего контента 💡\n"]
-    
-    for idea in ideas:
-        message_parts.append("━━━━━━━━━━━━━━━━")
-        message_parts.append(f"💡 **Идея {idea['id']}: \"{idea['title']}\"**\n")
-        message_parts.append(f"{idea['description']}\n")
-        
-        # Ключевые элементы если есть
-        if idea.get('key_elements'):
-            message_parts.append("**Ключевые элементы:**")
-            for element in idea['key_elements']:
-                message_parts.append(f"• {element}")
-            message_parts.append("")
-    
-    message_parts.append("━━━━━━━━━━━━━━━━")
-    message_parts.append("\nКакая идея тебе больше нравится? Выбери номер 👇")
+    footer = (
+        "\n⏳ Генерирую остальные идеи..."
+        if in_progress
+        else "\nКакая идея тебе больше нравится? Выбери номер 👇"
+    )
     
-    return "\n".join(message_parts)
+    return "\n".join([
+        "Вот 5 идей для твоего контента 💡\n",
+        *map(_format_idea_block, ideas),
+        _IDEAS_SEPARATOR,
+        footer,
+    ])
 
 
 def escape_markdown(text: str) -> str:
@@ -127,13 +189,7 @@ def escape_markdown(text: str) -> str:
     Returns:
         Текст с экранированными символами
     """
-    # Символы, которые нужно экранировать в Markdown V2
-    special_chars = ['_', '*', '[', ']', '(', ')', '~', '`', '>', '#', '+', '-', '=', '|', '{', '}', '.', '!']
-    
-    for char in special_chars:
-        text = text.replace(char, f'\\{char}')
-    
-    return text
+    return text.translate(_MARKDOWN_ESCAPE_TABLE)
 
 
 def truncate_text(text: str, max_length: int = 4000, suffix: str = "...") -> str:
@@ -204,9 +260,11 @@ def format_post_with_hashtags(post_data: dict) -> str:
     content = post_data.get("content", "")
     hashtags = post_data.get("hashtags", [])
     
-    # Добавляем хештеги в конец если их нет в тексте
-    if hashtags and not any(f"#{tag}" in content for tag in hashtags):
-        hashtag_string = " ".join([f"#{tag}" for tag in hashtags])
+    # Добавляем в конец хештеги, которых еще нет в тексте (текст сканируется один раз)
+    existing = set(_HASHTAG_RE.findall(content))
+    missing = [tag.lstrip("#") for tag in hashtags if tag.lstrip("#") not in existing]
+    if missing:
+        hashtag_string = " ".join(f"#{tag}" for tag in missing)
         content = f"{content}\n\n{hashtag_string}"
     
     return content
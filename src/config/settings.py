@@ -8,7 +8,7 @@
 import os
 from pathlib import Path
 from typing import Optional
-from pydantic import Field, field_validator
+from pydantic import Field, PrivateAttr, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 from core.exceptions import ConfigurationError
@@ -31,6 +31,26 @@ class Settings(BaseSettings):
         description="Токен Telegram бота от @BotFather"
     )
     
+    telegram_connection_limit: int = Field(
+        default=100,
+        ge=1,
+        le=1000,
+        description="Максимальное количество одновременных соединений с Telegram Bot API"
+    )
+    
+    telegram_rate_limit: float = Field(
+        default=29,
+        gt=0,
+        le=30,
+        description="Максимум исходящих запросов к Telegram в секунду (лимит Telegram - 30)"
+    )
+    
+    telegram_chat_rate_limit: float = Field(
+        default=1.0,
+        gt=0,
+        description="Максимум исходящих запросов в один чат в секунду (в среднем)"
+    )
+    
     # ===========================================
     # PROXYAPI (OpenAI)
     # ===========================================
@@ -51,7 +71,12 @@ class Settings(BaseSettings):
     
     model_text_generation: str = Field(
         default="gpt-4o-mini",
-        description="Модель для генерации текста (идеи, модерация)"
+        description="Модель для генерации текста (идеи, переформулировка, промпты изображений)"
+    )
+    
+    model_moderation: str = Field(
+        default="gpt-4o-mini",
+        description="Модель для проверки релевантности ответов (простая классификация - достаточно быстрой модели)"
     )
     
     model_final_post: str = Field(
@@ -69,6 +94,11 @@ class Settings(BaseSettings):
         description="Модель для транскрибации речи"
     )
     
+    model_embeddings: str = Field(
+        default="text-embedding-3-small",
+        description="Модель эмбеддингов для семантического кэша идей"
+    )
+    
     # ===========================================
     # ПАРАМЕТРЫ ГЕНЕРАЦИИ
     # ===========================================
@@ -147,6 +177,11 @@ class Settings(BaseSettings):
         description="Путь к файлу логов"
     )
     
+    log_console: bool = Field(
+        default=True,
+        description="Дублировать логи в консоль (stdout). Можно отключить, если логи уже пишутся в файл и stdout никто не читает"
+    )
+    
     # ===========================================
     # ПОВЕДЕНИЕ БОТА
     # ===========================================
@@ -158,6 +193,13 @@ class Settings(BaseSettings):
         description="Максимальное количество попыток отклонения от темы"
     )
     
+    moderation_timeout: float = Field(
+        default=2.0,
+        ge=0.1,
+        le=30.0,
+        description="Сколько секунд ждать AI-проверку релевантности, прежде чем принять ответ"
+    )
+    
     typing_timeout: int = Field(
         default=2,
         ge=1,
@@ -186,6 +228,47 @@ class Settings(BaseSettings):
         description="Коэффициент задержки на символ в секундах"
     )
     
+    prewarm_post: bool = Field(
+        default=False,
+        description="Заранее генерировать пост для первой идеи, пока пользователь выбирает"
+    )
+    
+    ideas_semantic_cache: bool = Field(
+        default=True,
+        description="Переиспользовать идеи для той же ниши с похожими по смыслу целью и форматом"
+    )
+    
+    ideas_cache_similarity: float = Field(
+        default=0.95,
+        ge=0.5,
+        le=1.0,
+        description="Минимальная косинусная близость цели и формата (при той же нише) для использования кэша идей"
+    )
+    
+    moderation_cache: bool = Field(
+        default=True,
+        description="Переиспользовать результаты модерации для совпадающих и похожих ответов"
+    )
+    
+    moderation_cache_similarity: float = Field(
+        default=0.95,
+        ge=0.5,
+        le=1.0,
+        description="Минимальная косинусная близость ответов для использования кэша модерации"
+    )
+    
+    image_cache: bool = Field(
+        default=True,
+        description="Переиспользовать изображения для совпадающих и похожих промптов"
+    )
+    
+    image_cache_similarity: float = Field(
+        default=0.97,
+        ge=0.5,
+        le=1.0,
+        description="Минимальная косинусная близость промптов для использования кэша изображений"
+    )
+    
     # ===========================================
     # РАСШИРЕННЫЕ НАСТРОЙКИ
     # ===========================================
@@ -205,12 +288,21 @@ class Settings(BaseSettings):
         description="Папка для сохранения изображений"
     )
     
+    redis_url: Optional[str] = Field(
+        default=None,
+        description="URL Redis для хранения состояний и сессий (если не задан - хранение в памяти)"
+    )
+    
+    # Сводка настроек, построенная при первом вызове get_summary
+    _summary: Optional[str] = PrivateAttr(default=None)
+    
     # Настройки для Pydantic
     model_config = SettingsConfigDict(
         env_file=".env",
         env_file_encoding="utf-8",
         case_sensitive=False,
         extra="ignore",  # игнорировать лишние поля
+        frozen=True,  # настройки не меняются после загрузки (hashable, без случайных изменений)
         protected_namespaces=()  # отключаем защиту namespace для полей model_*
     )
     
@@ -275,9 +367,17 @@ class Settings(BaseSettings):
         """
         Получить сводку текущих настроек
         
+        Настройки не меняются после загрузки, поэтому сводка строится один раз.
+        
         Returns:
             Строка с основными настройками (без секретов)
         """
+        if self._summary is None:
+            self._summary = self._build_summary()
+        return self._summary
+    
+    def _build_summary(self) -> str:
+        """Построить сводку настроек (см. get_summary)"""
         return f"""
 ╔══════════════════════════════════════════════════════════════╗
 ║                  КОНФИГУРАЦИЯ ПРИЛОЖЕНИЯ                     ║
@@ -287,6 +387,7 @@ class Settings(BaseSettings):
 ║ ProxyAPI URL: {self.proxyapi_base_url}
 ╠══════════════════════════════════════════════════════════════╣
 ║ Модель текста: {self.model_text_generation}
+║ Модель модерации: {self.model_moderation}
 ║ Модель изображений: {self.model_image_generation}
 ║ Модель транскрибации: {self.model_speech_to_text}
 ╠══════════════════════════════════════════════════════════════╣
@@ -297,6 +398,7 @@ class Settings(BaseSettings):
 ╠══════════════════════════════════════════════════════════════╣
 ║ Уровень логов: {self.log_level}
 ║ Файл логов: {self.log_file}
+║ Логи в консоль: {'✓ Включены' if self.log_console else '✗ Выключены'}
 ║ Размер лога: {self.log_max_bytes / 1024 / 1024:.1f} MB
 ║ Резервных копий: {self.log_backup_count}
 ╠══════════════════════════════════════════════════════════════╣
@@ -306,6 +408,7 @@ class Settings(BaseSettings):
 ╠══════════════════════════════════════════════════════════════╣
 ║ Debug mode: {'✓ Включен' if self.debug_mode else '✗ Выключен'}
 ║ Сохранение изображений: {'✓ Включено' if self.save_images_locally else '✗ Выключено'}
+║ Хранилище состояний: {'Redis' if self.redis_url else 'Память'}
 ╚══════════════════════════════════════════════════════════════╝
         """.strip()
 
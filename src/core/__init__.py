@@ -2,7 +2,9 @@
 Ядро системы: логирование, исключения, базовые утилиты
 """
 
-from .logger import get_logger, setup_logging
+from .logger import get_logger, setup_logging, shutdown_logging
+from .cache import LRUCache, SemanticCache
+from .rate_limiter import AsyncRateLimiter
 from .exceptions import (
     BotException,
     ConfigurationError,
@@ -16,6 +18,10 @@ from .exceptions import (
 __all__ = [
     "get_logger",
     "setup_logging",
+    "shutdown_logging",
+    "LRUCache",
+    "SemanticCache",
+    "AsyncRateLimiter",
     "BotException",
     "ConfigurationError",
     "APIError",
@@ -0,0 +1,144 @@
+"""
+In-memory кэши результатов запросов к AI
+
+- LRUCache: точное совпадение ключа с вытеснением по LRU
+- SemanticCache: поиск по близости эмбеддингов (похожие по смыслу запросы)
+
+Повторные запросы не стоят ни времени, ни токенов.
+"""
+
+import math
+import operator
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Sequence
+
+
+class LRUCache:
+    """
+    Ограниченный по размеру кэш с вытеснением давно неиспользуемых записей
+    
+    При превышении maxsize удаляется запись, к которой дольше всего не обращались.
+    Не потокобезопасен - рассчитан на использование внутри одного event loop.
+    """
+    
+    def __init__(self, maxsize: int = 1024):
+        """
+        Args:
+            maxsize: Максимальное количество записей в кэше
+        """
+        self.maxsize = maxsize
+        self._data: OrderedDict = OrderedDict()
+    
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Получить значение из кэша
+        
+        Args:
+            key: Ключ записи
+        
+        Returns:
+            Значение или None, если записи нет
+        """
+        try:
+            self._data.move_to_end(key)
+        except KeyError:
+            return None
+        return self._data[key]
+    
+    def set(self, key: Hashable, value: Any) -> None:
+        """
+        Сохранить значение в кэш
+        
+        Args:
+            key: Ключ записи
+            value: Значение
+        """
+        self._data[key] = value
+        self._data.move_to_end(key)
+        
+        if len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._data.clear()
+
+
+class SemanticCache:
+    """
+    Кэш с поиском по косинусной близости эмбеддингов
+    
+    Векторы нормализуются при сохранении, поэтому близость считается
+    одним скалярным произведением. Поиск - полный перебор: записей немного,
+    и это на порядки быстрее запроса к AI, который кэш заменяет.
+    Не потокобезопасен - рассчитан на использование внутри одного event loop.
+    """
+    
+    def __init__(self, maxsize: int = 256, threshold: float = 0.92, ttl: float = 7 * 24 * 3600):
+        """
+        Args:
+            maxsize: Максимальное количество записей (старые вытесняются первыми)
+            threshold: Минимальная косинусная близость для попадания в кэш
+            ttl: Время жизни записи в секундах
+        """
+        self.maxsize = maxsize
+        self.threshold = threshold
+        self.ttl = ttl
+        # Записи в порядке добавления: (время добавления, нормализованный вектор, значение)
+        self._entries: List[tuple] = []
+    
+    @staticmethod
+    def _normalize(vector: Sequence[float]) -> List[float]:
+        norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+        return [x / norm for x in vector]
+    
+    def get(self, vector: Sequence[float]) -> Optional[Any]:
+        """
+        Найти значение для самого близкого вектора
+        
+        Args:
+            vector: Эмбеддинг запроса
+        
+        Returns:
+            Значение или None, если нет записи с близостью выше порога
+        """
+        now = time.monotonic()
+        self._entries = [entry for entry in self._entries if now - entry[0] < self.ttl]
+        
+        query = self._normalize(vector)
+        best_value = None
+        best_similarity = self.threshold
+        for _, cached_vector, value in self._entries:
+            similarity = sum(map(operator.mul, query, cached_vector))
+            if similarity >= best_similarity:
+                best_similarity = similarity
+                best_value = value
+        
+        return best_value
+    
+    def set(self, vector: Sequence[float], value: Any) -> None:
+        """
+        Сохранить значение для вектора
+        
+        Args:
+            vector: Эмбеддинг запроса
+            value: Значение
+        """
+        self._entries.append((time.monotonic(), self._normalize(vector), value))
+        
+        if len(self._entries) > self.maxsize:
+            del self._entries[0]
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+    
+    def clear(self) -> None:
+        """Очистить кэш"""
+        self._entries.clear()
@@ -10,8 +10,12 @@ class BotException(Exception):
     Базовое исключение для всех ошибок бота
     
     От него наследуются все остальные исключения для единообразной обработки.
+    Атрибуты хранятся в __slots__: при всплеске ошибок (например, rate limit)
+    у экземпляров не создается собственный __dict__.
     """
     
+    __slots__ = ("message", "original_error")
+    
     def __init__(self, message: str, original_error: Exception = None):
         """
         Args:
@@ -21,6 +25,21 @@ class BotException(Exception):
         self.message = message
         self.original_error = original_error
         super().__init__(self.message)
+    
+    def __reduce__(self):
+        # Стандартный __reduce__ исключений сохраняет только __dict__ - добавляем
+        # значения из __slots__ всей иерархии, чтобы copy и pickle их не теряли
+        state = {
+            name: getattr(self, name)
+            for cls in type(self).__mro__
+            for name in getattr(cls, "__slots__", ())
+            if hasattr(self, name)
+        }
+        return self.__class__, self.args, state
+    
+    def __setstate__(self, state: dict) -> None:
+        for name, value in state.items():
+            setattr(self, name, value)
 
 
 class ConfigurationError(BotException):
@@ -42,6 +61,8 @@ class APIError(BotException):
     Используется для общих проблем с внешними API (ProxyAPI/OpenAI).
     """
     
+    __slots__ = ("status_code",)
+    
     def __init__(self, message: str, status_code: int = None, original_error: Exception = None):
         """
         Args:
@@ -73,6 +94,8 @@ class APIRateLimitError(APIError):
     Требует повторной попытки через некоторое время.
     """
     
+    __slots__ = ("retry_after",)
+    
     def __init__(self, message: str, retry_after: int = None, original_error: Exception = None):
         """
         Args:
@@ -0,0 +1,40 @@
+"""
+Быстрая (де)сериализация JSON
+
+Использует orjson, если он установлен, иначе стандартный модуль json.
+Интерфейс одинаковый: json_dumps возвращает str, json_loads принимает str или bytes.
+"""
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson не обязателен
+    orjson = None
+
+
+if orjson is not None:
+    # OPT_NON_STR_KEYS: как и json.dumps, допускаем нестроковые ключи словарей
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+    
+    def json_dumps(obj: Any) -> str:
+        """Сериализовать объект в JSON строку"""
+        return orjson.dumps(obj, option=_ORJSON_OPTIONS).decode("utf-8")
+    
+    def json_loads(data: Union[str, bytes]) -> Any:
+        """Разобрать JSON строку"""
+        return orjson.loads(data)
+
+else:
+    def json_dumps(obj: Any) -> str:
+        """Сериализовать объект в JSON строку"""
+        return json.dumps(obj, ensure_ascii=False)
+    
+    def json_loads(data: Union[str, bytes]) -> Any:
+        """Разобрать JSON строку"""
+        return json.loads(data)
+
+
+# Ошибка разбора JSON для обоих вариантов (orjson.JSONDecodeError наследует ее)
+JSONDecodeError = json.JSONDecodeError
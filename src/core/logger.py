@@ -7,25 +7,62 @@
 - Несколько уровней логирования (DEBUG, INFO, WARNING, ERROR, CRITICAL)
 - Форматирование с временем, уровнем и модулем
 - Ограничение размера лог-файлов
+- Запись в фоновом потоке: вызов logger.info(...) в event loop только
+  кладет запись в очередь, запись в файл и консоль идет вне event loop
 """
 
+import atexit
+import functools
 import logging
+import queue
+import re
 import sys
-from pathlib import Path
-from logging.handlers import RotatingFileHandler
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
+
+# pathlib и logging.handlers нужны только в setup_logging (вызывается один раз) -
+# импортируются там, чтобы не замедлять импорт модуля, от которого зависят все остальные
+if TYPE_CHECKING:
+    from logging.handlers import QueueListener
 
 
 # Глобальный флаг инициализации
 _logging_initialized = False
 
+# Фоновый поток, который пишет записи из очереди в файл и консоль
+_queue_listener: Optional["QueueListener"] = None
+
+# Параметры запросов, значения которых не пишутся в лог
+_SENSITIVE_PARAM_RE = re.compile(r"key|token|secret|password", re.IGNORECASE)
+
+
+class _CachedTimeFormatter(logging.Formatter):
+    """
+    Форматтер, который форматирует время один раз в секунду
+    
+    Формат даты без миллисекунд одинаков для всех записей в пределах секунды,
+    поэтому результат strftime переиспользуется для пачки записей.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second: Optional[int] = None
+        self._cached_time = ""
+    
+    def formatTime(self, record: logging.LogRecord, datefmt: Optional[str] = None) -> str:
+        second = int(record.created)
+        if second != self._cached_second:
+            self._cached_time = super().formatTime(record, datefmt)
+            self._cached_second = second
+        return self._cached_time
+
 
 def setup_logging(
     log_level: str = "INFO",
     log_file: str = "logs/bot.log",
     max_bytes: int = 10485760,  # 10MB
     backup_count: int = 5,
-    log_format: str = "detailed"
+    log_format: str = "detailed",
+    console: bool = True
 ) -> None:
     """
     Настройка системы логирования
@@ -39,12 +76,17 @@ def setup_logging(
         max_bytes: Максимальный размер файла лога в байтах
         backup_count: Количество резервных копий лог-файлов
         log_format: Формат логов (simple, detailed, json)
+        console: Дублировать логи в консоль (stdout). Без консоли каждая запись
+            обрабатывается одним handler - файлом
     """
-    global _logging_initialized
+    global _logging_initialized, _queue_listener
     
     if _logging_initialized:
         return
     
+    from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+    from pathlib import Path
+    
     # Создаем папку для логов, если не существует
     log_path = Path(log_file)
     log_path.parent.mkdir(parents=True, exist_ok=True)
@@ -65,7 +107,7 @@ def setup_logging(
     date_format = "%Y-%m-%d %H:%M:%S"
     
     # Создаем форматтер
-    formatter = logging.Formatter(format_string, datefmt=date_format)
+    formatter = _CachedTimeFormatter(format_string, datefmt=date_format)
     
     # Настраиваем корневой логгер
     root_logger = logging.getLogger()
@@ -83,19 +125,37 @@ def setup_logging(
     )
     file_handler.setLevel(level)
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
+    
+    # Файл пишется без буфера в памяти: запись уже идет в фоновом потоке
+    # QueueListener, а буфер терял бы последние записи при аварийном завершении
+    handlers = [file_handler]
     
     # Handler для вывода в консоль
-    console_handler = logging.StreamHandler(sys.stdout)
-    console_handler.setLevel(level)
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setLevel(level)
+        
+        # Для консоли используем цветной формат (если терминал поддерживает)
+        console_formatter = _CachedTimeFormatter(
+            "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
+            datefmt="%H:%M:%S"
+        )
+        console_handler.setFormatter(console_formatter)
+        handlers.append(console_handler)
     
-    # Для консоли используем цветной формат (если терминал поддерживает)
-    console_formatter = logging.Formatter(
-        "%(asctime)s | %(levelname)-8s | %(name)s | %(message)s",
-        datefmt="%H:%M:%S"
+    # Корневой логгер только кладет записи в очередь, реальные handlers
+    # работают в фоновом потоке QueueListener
+    log_queue: queue.Queue = queue.Queue(-1)
+    root_logger.addHandler(QueueHandler(log_queue))
+    _queue_listener = QueueListener(
+        log_queue,
+        *handlers,
+        respect_handler_level=True
     )
-    console_handler.setFormatter(console_formatter)
-    root_logger.addHandler(console_handler)
+    _queue_listener.start()
+    
+    # Очередь дописывается в файл и при выходе без вызова shutdown_logging
+    atexit.register(shutdown_logging)
     
     # Отключаем логи от сторонних библиотек (слишком много шума)
     logging.getLogger("httpx").setLevel(logging.WARNING)
@@ -105,20 +165,45 @@ def setup_logging(
     _logging_initialized = True
     
     # Логируем успешную инициализацию
+    # Одной записью, а не строкой на каждый параметр
     logger = get_logger(__name__)
-    logger.info("=" * 80)
-    logger.info("Система логирования инициализирована")
-    logger.info(f"Уровень логирования: {log_level}")
-    logger.info(f"Файл логов: {log_file}")
-    logger.info(f"Максимальный размер файла: {max_bytes / 1024 / 1024:.1f} MB")
-    logger.info(f"Количество резервных копий: {backup_count}")
-    logger.info("=" * 80)
+    logger.info("\n".join([
+        "=" * 80,
+        "Система логирования инициализирована",
+        f"Уровень логирования: {log_level}",
+        f"Файл логов: {log_file}",
+        f"Максимальный размер файла: {max_bytes / 1024 / 1024:.1f} MB",
+        f"Количество резервных копий: {backup_count}",
+        "=" * 80,
+    ]))
 
 
+def shutdown_logging() -> None:
+    """
+    Остановить фоновую запись логов
+    
+    Дописывает оставшиеся в очереди записи и закрывает файлы.
+    Вызывается при завершении работы приложения.
+    """
+    global _queue_listener
+    
+    if _queue_listener is None:
+        return
+    
+    _queue_listener.stop()
+    for handler in _queue_listener.handlers:
+        handler.close()
+    _queue_listener = None
+
+
+@functools.lru_cache(maxsize=None)
 def get_logger(name: str) -> logging.Logger:
     """
     Получение логгера для модуля
     
+    Логгеры кэшируются: повторный вызов с тем же именем не обращается
+    к реестру logging (и его блокировке).
+    
     Используйте так:
     ```python
     from core.logger import get_logger
@@ -149,9 +234,9 @@ def log_exception(logger: logging.Logger, exception: Exception, context: str = "
         context: Дополнительный контекст (что делали, когда произошла ошибка)
     """
     if context:
-        logger.error(f"{context}: {type(exception).__name__}: {str(exception)}", exc_info=True)
+        logger.error("%s: %s: %s", context, type(exception).__name__, exception, exc_info=True)
     else:
-        logger.error(f"{type(exception).__name__}: {str(exception)}", exc_info=True)
+        logger.error("%s: %s", type(exception).__name__, exception, exc_info=True)
 
 
 def log_api_request(
@@ -169,13 +254,17 @@ def log_api_request(
         endpoint: URL эндпоинта
         params: Параметры запроса (опционально, не логируем секреты!)
     """
+    # Запрос пишется на уровне DEBUG - без него не собираем параметры и строку
+    if not logger.isEnabledFor(logging.DEBUG):
+        return
+    
     if params:
         # Скрываем чувствительные данные
-        safe_params = {k: "***" if "key" in k.lower() or "token" in k.lower() else v 
+        safe_params = {k: "***" if _SENSITIVE_PARAM_RE.search(k) else v
                        for k, v in params.items()}
-        logger.debug(f"API Request: {method} {endpoint} | Params: {safe_params}")
+        logger.debug("API Request: %s %s | Params: %s", method, endpoint, safe_params)
     else:
-        logger.debug(f"API Request: {method} {endpoint}")
+        logger.debug("API Request: %s %s", method, endpoint)
 
 
 def log_api_response(
@@ -194,9 +283,13 @@ def log_api_response(
         success: Успешен ли запрос
     """
     level = logging.INFO if success else logging.ERROR
+    if not logger.isEnabledFor(level):
+        return
+    
     logger.log(
         level,
-        f"API Response: {status_code} | Time: {response_time:.2f}s | Success: {success}"
+        "API Response: %s | Time: %.2fs | Success: %s",
+        status_code, response_time, success
     )
 
 
@@ -215,8 +308,11 @@ def log_user_action(
         action: Описание действия
         details: Дополнительные детали (опционально)
     """
+    if not logger.isEnabledFor(logging.INFO):
+        return
+    
     if details:
-        logger.info(f"User {user_id} | {action} | {details}")
+        logger.info("User %s | %s | %s", user_id, action, details)
     else:
-        logger.info(f"User {user_id} | {action}")
+        logger.info("User %s | %s", user_id, action)
 
@@ -0,0 +1,55 @@
+"""
+Асинхронный ограничитель частоты запросов (token bucket)
+
+Используется для соблюдения лимитов внешних API: вместо ошибок
+"слишком много запросов" вызовы выстраиваются в очередь и выполняются
+с допустимой скоростью.
+"""
+
+import asyncio
+import time
+from typing import Optional
+
+
+class AsyncRateLimiter:
+    """
+    Ограничитель частоты по алгоритму token bucket
+
+    Допускает кратковременный всплеск до burst вызовов, в среднем -
+    не чаще rate вызовов в секунду. Ожидающие вызовы обслуживаются
+    в порядке очереди. Рассчитан на использование внутри одного event loop.
+    """
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        """
+        Args:
+            rate: Средняя допустимая частота (вызовов в секунду)
+            burst: Размер всплеска (по умолчанию - rate, но не меньше 1)
+        """
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        """Дождаться разрешения на один вызов"""
+        async with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+
+            if self._tokens < 1:
+                # Ждем ровно столько, сколько нужно для накопления одного токена
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+                self._tokens = 0.0
+                self._updated_at = time.monotonic()
+            else:
+                self._tokens -= 1
+
+    async def __aenter__(self) -> "AsyncRateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        return None
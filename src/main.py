@@ -8,10 +8,12 @@ import asyncio
 import sys
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
 from aiogram.enums import ParseMode
 from aiogram.fsm.storage.memory import MemoryStorage
 
-from core.logger import setup_logging, get_logger
+from core.logger import setup_logging, shutdown_logging, get_logger
+from core.json_utils import json_dumps, json_loads
 from core.exceptions import ConfigurationError
 from config.settings import get_settings
 from api.proxyapi_client import ProxyAPIClient
@@ -23,9 +25,17 @@ from services.post_generator import PostGenerator
 from bot.handlers.start import start_router
 from bot.handlers.conversation import conversation_router, setup_services
 from bot.handlers.voice import voice_router, setup_api_client
+from bot.middlewares import RateLimitMiddleware
 
 logger = get_logger(__name__)
 
+_BANNER_LINE = "=" * 80
+
+
+def log_banner(*lines: str) -> None:
+    """Записать заголовок этапа (строки между разделителями) одной записью лога"""
+    logger.info("\n".join([_BANNER_LINE, *lines, _BANNER_LINE]))
+
 
 async def main():
     """
@@ -57,12 +67,11 @@ async def main():
             log_file=settings.log_file,
             max_bytes=settings.log_max_bytes,
             backup_count=settings.log_backup_count,
-            log_format=settings.log_format
+            log_format=settings.log_format,
+            console=settings.log_console
         )
         
-        logger.info("=" * 80)
-        logger.info("ЗАПУСК CONTENT IDEAS GENERATOR BOT")
-        logger.info("=" * 80)
+        log_banner("ЗАПУСК CONTENT IDEAS GENERATOR BOT")
         
         # ========================================
         # ЭТАП 2: ВАЛИДАЦИЯ КОНФИГУРАЦИИ
@@ -94,14 +103,10 @@ async def main():
             max_retries=3
         )
         
-        # Проверка подключения к API
+        # Проверка подключения к API - сетевой запрос, идет в фоне, пока
+        # создаются сервисы, бот и диспетчер; результат проверяем перед запуском
         logger.info("Проверка подключения к ProxyAPI...")
-        if await api_client.validate_connection():
-            logger.info("✓ Подключение к ProxyAPI успешно")
-        else:
-            logger.error("✗ Не удалось подключиться к ProxyAPI")
-            logger.error("Проверьте API ключ и доступность сервиса")
-            # Продолжаем работу, возможно проблемы временные
+        validate_task = asyncio.create_task(api_client.validate_connection())
         
         # ========================================
         # ЭТАП 4: ИНИЦИАЛИЗАЦИЯ СЕРВИСОВ
@@ -139,13 +144,34 @@ async def main():
         # Создание бота
         bot = Bot(
             token=settings.telegram_bot_token,
+            session=AiohttpSession(limit=settings.telegram_connection_limit),
             default=DefaultBotProperties(
                 parse_mode=ParseMode.MARKDOWN
             )
         )
         
-        # Создание диспетчера с хранилищем в памяти
-        storage = MemoryStorage()
+        # Исходящие запросы встают в очередь вместо того, чтобы упираться в лимиты Telegram
+        bot.session.middleware(RateLimitMiddleware(
+            global_rate=settings.telegram_rate_limit,
+            chat_rate=settings.telegram_chat_rate_limit
+        ))
+        
+        # Создание диспетчера: Redis позволяет запускать несколько экземпляров бота,
+        # без него состояния хранятся в памяти процесса
+        if settings.redis_url:
+            from aiogram.fsm.storage.base import DefaultKeyBuilder
+            from aiogram.fsm.storage.redis import RedisStorage
+            storage = RedisStorage.from_url(
+                settings.redis_url,
+                # Ключи с destiny: данные сессии и идеи хранятся отдельными записями
+                key_builder=DefaultKeyBuilder(with_destiny=True),
+                json_loads=json_loads,
+                json_dumps=json_dumps
+            )
+            logger.info("✓ Хранилище состояний: Redis")
+        else:
+            storage = MemoryStorage()
+            logger.info("✓ Хранилище состояний: память")
         dp = Dispatcher(storage=storage)
         
         logger.info("✓ Bot и Dispatcher созданы")
@@ -175,15 +201,22 @@ async def main():
         dp.include_router(conversation_router)
         logger.info("✓ Conversation handler зарегистрирован")
         
+        if await validate_task:
+            logger.info("✓ Подключение к ProxyAPI успешно")
+        else:
+            logger.error("✗ Не удалось подключиться к ProxyAPI")
+            logger.error("Проверьте API ключ и доступность сервиса")
+            # Продолжаем работу, возможно проблемы временные
+        
         # ========================================
         # ЭТАП 7: ЗАПУСК БОТА
         # ========================================
         
-        logger.info("=" * 80)
-        logger.info("БОТ ГОТОВ К РАБОТЕ")
-        logger.info("Ожидание сообщений...")
-        logger.info("Нажмите Ctrl+C для остановки")
-        logger.info("=" * 80)
+        log_banner(
+            "БОТ ГОТОВ К РАБОТЕ",
+            "Ожидание сообщений...",
+            "Нажмите Ctrl+C для остановки"
+        )
         
         # Удаляем вебхук если был (на случай предыдущего использования webhook mode)
         await bot.delete_webhook(drop_pending_updates=True)
@@ -203,22 +236,27 @@ async def main():
         # ЗАВЕРШЕНИЕ РАБОТЫ
         # ========================================
         
-        logger.info("=" * 80)
-        logger.info("ЗАВЕРШЕНИЕ РАБОТЫ БОТА")
-        logger.info("=" * 80)
+        log_banner("ЗАВЕРШЕНИЕ РАБОТЫ БОТА")
         
         # Закрываем API клиент
         if 'api_client' in locals():
             await api_client.close()
             logger.info("✓ API клиент закрыт")
         
+        # Закрываем хранилище состояний
+        if 'storage' in locals():
+            await storage.close()
+            logger.info("✓ Хранилище состояний закрыто")
+        
         # Закрываем бота
         if 'bot' in locals():
             await bot.session.close()
             logger.info("✓ Bot session закрыт")
         
-        logger.info("Бот остановлен")
-        logger.info("=" * 80)
+        logger.info(f"Бот остановлен\n{_BANNER_LINE}")
+        
+        # Дописываем логи из очереди
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -227,6 +265,13 @@ if __name__ == "__main__":
     
     Запускает главную асинхронную функцию.
     """
+    # uvloop (если установлен) - более быстрый event loop на libuv; без него - стандартный
+    try:
+        import uvloop
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    except ImportError:
+        pass
+    
     try:
         # Запускаем main через asyncio
         asyncio.run(main())
@@ -4,10 +4,23 @@
 Берут шаблоны из templates.py и заполняют их реальными данными.
 """
 
-from typing import Dict, List
+from functools import lru_cache
+from typing import Dict, List, Tuple
 from .templates import PromptTemplates
 
 
+# Системные сообщения по ролям AI. Создаются один раз и возвращаются
+# build_system_message как есть, поэтому изменять их нельзя
+_SYSTEM_MESSAGES: Dict[str, Dict[str, str]] = {
+    role: {"role": "system", "content": content}
+    for role, content in {
+        "helper": "Ты - полезный помощник в создании контента. Ты дружелюбен, профессионален и всегда стремишься помочь.",
+        "moderator": "Ты - модератор диалога. Твоя задача объективно оценивать релевантность сообщений.",
+        "creator": "Ты - креативный специалист по контент-маркетингу с богатым опытом."
+    }.items()
+}
+
+
 class PromptBuilder:
     """
     Построитель промптов с подстановкой данных
@@ -41,6 +54,7 @@ class PromptBuilder:
         )
     
     @staticmethod
+    @lru_cache(maxsize=512)
     def build_ideas_prompt(
         niche: str,
         goal: str,
@@ -55,7 +69,8 @@ class PromptBuilder:
             format_type: Формат контента
             
         Returns:
-            Готовый промпт для AI
+            Готовый промпт для AI (кэшируется: многие пользователи
+            запрашивают одни и те же ниши, цели и форматы)
         """
         template = PromptTemplates.ideas_generation_prompt()
         
@@ -88,10 +103,30 @@ class PromptBuilder:
         Returns:
             Готовый промпт для AI
         """
+        # Список не хэшируется - для кэша передаем кортеж
+        return PromptBuilder._build_post_prompt(
+            niche, goal, format_type, idea_title, idea_description, tuple(key_elements)
+        )
+    
+    @staticmethod
+    @lru_cache(maxsize=256)
+    def _build_post_prompt(
+        niche: str,
+        goal: str,
+        format_type: str,
+        idea_title: str,
+        idea_description: str,
+        key_elements: Tuple[str, ...]
+    ) -> str:
+        """
+        Промпт для генерации поста (кэшируется: идеи из семантического кэша
+        выбирают разные пользователи, а пост для одной идеи генерируется
+        повторно при заблаговременной генерации и перегенерации)
+        """
         template = PromptTemplates.post_generation_prompt()
         
-        # Форматируем key_elements как список
-        key_elements_str = ", ".join([f'"{elem}"' for elem in key_elements])
+        # Форматируем key_elements как список: "a", "b", "c"
+        key_elements_str = '"' + '", "'.join(map(str, key_elements)) + '"' if key_elements else ""
         
         return template.format(
             niche=niche,
@@ -103,6 +138,7 @@ class PromptBuilder:
         )
     
     @staticmethod
+    @lru_cache(maxsize=256)
     def build_image_prompt_prompt(
         niche: str,
         format_type: str,
@@ -119,7 +155,8 @@ class PromptBuilder:
             post_content: Содержание поста
             
         Returns:
-            Готовый промпт для AI
+            Готовый промпт для AI (кэшируется: изображение, генерируемое параллельно
+            с текстом, строится по описанию идеи, а идеи повторяются)
         """
         template = PromptTemplates.image_prompt_generation()
         
@@ -134,6 +171,25 @@ class PromptBuilder:
             post_content=post_content
         )
     
+    @staticmethod
+    def build_reformulation_prompt(context: str, user_text: str) -> str:
+        """
+        Построить промпт для переформулировки ответа пользователя
+        
+        Args:
+            context: Поле диалога ('niche', 'goal', 'format')
+            user_text: Текст пользователя
+            
+        Returns:
+            Готовый промпт для AI
+        """
+        template = PromptTemplates.reformulation_prompt()
+        
+        return template.format(
+            rules=PromptTemplates.REFORMULATION_RULES[context],
+            user_text=user_text
+        )
+    
     @staticmethod
     def build_system_message(role: str = "helper") -> Dict[str, str]:
         """
@@ -143,18 +199,9 @@ class PromptBuilder:
             role: Роль AI (helper, moderator, creator)
             
         Returns:
-            Словарь с системным сообщением
+            Словарь с системным сообщением (общий экземпляр - не изменять)
         """
-        roles = {
-            "helper": "Ты - полезный помощник в создании контента. Ты дружелюбен, профессионален и всегда стремишься помочь.",
-            "moderator": "Ты - модератор диалога. Твоя задача объективно оценивать релевантность сообщений.",
-            "creator": "Ты - креативный специалист по контент-маркетингу с богатым опытом."
-        }
-        
-        return {
-            "role": "system",
-            "content": roles.get(role, roles["helper"])
-        }
+        return _SYSTEM_MESSAGES.get(role, _SYSTEM_MESSAGES["helper"])
     
     @staticmethod
     def build_user_message(content: str) -> Dict[str, str]:
@@ -182,10 +229,11 @@ class PromptBuilder:
             user_prompt: Промпт пользователя
             
         Returns:
-            Список сообщений для API
+            Список сообщений для API. Список и пользовательское сообщение -
+            новые объекты, системное сообщение - общее (не изменять)
         """
         return [
-            PromptBuilder.build_system_message(system_role),
-            PromptBuilder.build_user_message(user_prompt)
+            _SYSTEM_MESSAGES.get(system_role, _SYSTEM_MESSAGES["helper"]),
+            {"role": "user", "content": user_prompt}
         ]
 
@@ -15,6 +15,10 @@ class PromptTemplates:
     
     Каждый промпт оптимизирован для конкретной задачи и настроен
     на возврат структурированных JSON ответов.
+    
+    Данные пользователя подставляются в конец шаблона: неизменная часть
+    (инструкции, формат ответа, примеры) остается общим префиксом запросов
+    и попадает в кэш промптов на стороне провайдера.
     """
     
     @staticmethod
@@ -26,11 +30,6 @@ class PromptTemplates:
         """
         return """Ты - модератор диалога в Telegram-боте для генерации контент-идей.
 
-КОНТЕКСТ:
-Бот на этапе: {current_step}
-Бот задал вопрос: "{bot_question}"
-Пользователь ответил: "{user_response}"
-
 ЗАДАЧА:
 Определи, относится ли ответ пользователя к заданному вопросу или это попытка отклониться от темы.
 
@@ -71,7 +70,12 @@ class PromptTemplates:
 Ответ: "Блин ну не знаю как сказать"
 → {{"is_relevant": true, "reason": "Пользователь пытается ответить, но затрудняется", "suggestion": ""}}
 
-Отвечай ТОЛЬКО JSON без дополнительного текста."""
+Отвечай ТОЛЬКО JSON без дополнительного текста.
+
+КОНТЕКСТ:
+Бот на этапе: {current_step}
+Бот задал вопрос: "{bot_question}"
+Пользователь ответил: "{user_response}\""""
     
     @staticmethod
     def ideas_generation_prompt() -> str:
@@ -85,11 +89,6 @@ class PromptTemplates:
 ЗАДАЧА:
 Создай 5 уникальных и разнообразных идей для контента на основе параметров пользователя.
 
-ПАРАМЕТРЫ:
-• Ниша: {niche}
-• Цель контента: {goal}
-• Формат: {format}
-
 ТРЕБОВАНИЯ К ИДЕЯМ:
 
 1. РЕЛЕВАНТНОСТЬ:
@@ -184,7 +183,12 @@ class PromptTemplates:
 - Идеи должны отличаться друг от друга
 - Отвечай ТОЛЬКО JSON без дополнительного текста
 
-Создай 5 идей для контента с параметрами выше."""
+Создай 5 идей для контента с параметрами ниже.
+
+ПАРАМЕТРЫ:
+• Ниша: {niche}
+• Цель контента: {goal}
+• Формат: {format}"""
     
     @staticmethod
     def post_generation_prompt() -> str:
@@ -204,18 +208,6 @@ class PromptTemplates:
 ТВОЯ ЗАДАЧА:
 Напиши пост, который зацепит с первых слов и не отпустит до последней точки.
 
-ПАРАМЕТРЫ:
-• Ниша: {niche}
-• Цель: {goal}
-• Формат: {format}
-
-ВЫБРАННАЯ ИДЕЯ:
-• Название: {idea_title}
-• Описание: {idea_description}
-• Ключевые элементы: {key_elements}
-
-═══════════════════════════════════════════════
-
 🎯 ЗОЛОТЫЕ ПРАВИЛА КРЕАТИВА:
 
 1. **НИКАКИХ СПИСКОВ В СТИЛЕ МЕНЮ!**
@@ -388,7 +380,19 @@ class PromptTemplates:
 
 Вперёд, мастер! Создай шедевр для выбранной идеи. 🎨
 
-Отвечай ТОЛЬКО JSON без дополнительного текста."""
+Отвечай ТОЛЬКО JSON без дополнительного текста.
+
+═══════════════════════════════════════════════
+
+ПАРАМЕТРЫ:
+• Ниша: {niche}
+• Цель: {goal}
+• Формат: {format}
+
+ВЫБРАННАЯ ИДЕЯ:
+• Название: {idea_title}
+• Описание: {idea_description}
+• Ключевые элементы: {key_elements}"""
     
     @staticmethod
     def image_prompt_generation() -> str:
@@ -402,14 +406,6 @@ class PromptTemplates:
 ЗАДАЧА:
 Создай детальный промпт на английском языке для генерации изображения, которое идеально дополнит пост.
 
-КОНТЕКСТ:
-• Ниша: {niche}
-• Формат: {format}
-• Название поста: {post_title}
-
-ТЕКСТ ПОСТА:
-{post_content}
-
 ТРЕБОВАНИЯ К IMAGE PROMPT:
 
 1. РЕЛЕВАНТНОСТЬ:
@@ -495,5 +491,48 @@ class PromptTemplates:
 - Промпт 40-80 слов
 - Отвечай ТОЛЬКО JSON
 
-Создай image prompt для поста выше."""
+Создай image prompt для поста ниже.
 
+КОНТЕКСТ:
+• Ниша: {niche}
+• Формат: {format}
+• Название поста: {post_title}
+
+ТЕКСТ ПОСТА:
+{post_content}"""
+    
+    # Правила переформулировки для каждого поля диалога
+    REFORMULATION_RULES = {
+        "niche": """Ниша/тема контента:
+- Если написано как действие ("я хлеб пеку", "делаю мебель"), преобразуй в существительное ("Выпечка хлеба", "Изготовление мебели")
+- Если написано некорректно ("собираю машины"), сделай грамотно ("Сборка автомобилей")
+- Сделай формулировку профессиональной
+- Максимум 3-5 слов
+- Только суть, без лишних слов""",
+        "goal": """Цель контента:
+- Преобразуй в инфинитив если нужно ("хочу клиентов" → "Привлечение клиентов")
+- Сделай формулировку четкой и профессиональной
+- Максимум 5-7 слов""",
+        "format": """Формат контента:
+- Сделай формулировку четкой ("пост инсте" → "Пост для Instagram")
+- Максимум 5-7 слов""",
+    }
+    
+    @staticmethod
+    def reformulation_prompt() -> str:
+        """
+        Промпт для переформулировки ответа пользователя
+        
+        Общий для всех полей диалога (niche, goal, format): правила поля
+        подставляются из REFORMULATION_RULES.
+        """
+        return """Переформулируй ответ пользователя в грамотную форму.
+
+ПРАВИЛА:
+{rules}
+- Сохрани смысл
+
+Ответь ТОЛЬКО переформулированным текстом, без кавычек и объяснений.
+
+Пользователь написал: "{user_text}"
+"""
@@ -4,10 +4,18 @@
 Генерирует 5 уникальных идей на основе параметров пользователя.
 """
 
+import re
 import json
-from typing import List, Dict
+import copy
+import random
+import asyncio
+from typing import Any, AsyncIterator, List, Dict, Optional
+
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import TypedDict
 
 from core.logger import get_logger, log_exception
+from core.cache import LRUCache, SemanticCache
 from core.exceptions import GenerationError
 from api.proxyapi_client import ProxyAPIClient
 from prompts.builders import PromptBuilder
@@ -15,6 +23,37 @@ from config.settings import Settings
 
 logger = get_logger(__name__)
 
+# Начало массива идей в JSON ответе: {"ideas": [
+_IDEAS_ARRAY_RE = re.compile(r'"ideas"\s*:\s*\[')
+_JSON_DECODER = json.JSONDecoder()
+
+# Семантический кэш идей: отдельный кэш для каждой ниши (ниши не смешиваются -
+# идеи кофейни не должны достаться пекарне), внутри ниши - по близости цели и формата
+_MAX_CACHED_NICHES = 1024
+_MAX_CACHED_REQUESTS_PER_NICHE = 32
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+# Обязательные поля каждой идеи
+_REQUIRED_IDEA_FIELDS = frozenset(("id", "title", "description", "key_elements"))
+
+
+class _IdeaSchema(TypedDict):
+    """Идея в ответе модели (id может быть любым - исправляется на порядковый номер)"""
+    id: Any
+    title: str
+    description: str
+    key_elements: List[Any]
+
+
+class _IdeasResponseSchema(TypedDict):
+    """Ответ модели с идеями: {"ideas": [...]}"""
+    ideas: List[_IdeaSchema]
+
+
+# Разбор и проверка ответа одним вызовом; результат - обычные dict
+_IDEAS_RESPONSE_ADAPTER = TypeAdapter(_IdeasResponseSchema)
+
 
 class IdeaGenerator:
     """
@@ -33,20 +72,152 @@ class IdeaGenerator:
         """
         self.api_client = api_client
         self.settings = settings
+        
+        # Идеи для той же ниши и похожих по смыслу цели и формата:
+        # нормализованная ниша -> SemanticCache
+        self._semantic_caches = LRUCache(maxsize=_MAX_CACHED_NICHES)
+    
+    @staticmethod
+    def _niche_key(niche: str) -> str:
+        """Нормализованная ниша - ключ кэша идей"""
+        return _WHITESPACE_RE.sub(" ", niche.lower()).strip(" .,!?;:")
+    
+    async def _embed_request(self, goal: str, format_type: str) -> Optional[List[float]]:
+        """
+        Эмбеддинг цели и формата для семантического кэша
+        
+        Returns:
+            Вектор или None, если эмбеддинг получить не удалось
+        """
+        try:
+            return await self.api_client.create_embedding(
+                f"{goal} | {format_type}",
+                model=self.settings.model_embeddings
+            )
+        except Exception as e:
+            logger.warning(f"Семантический кэш идей недоступен: {e}")
+            return None
+    
+    def _start_embedding(self, goal: str, format_type: str) -> Optional[asyncio.Task]:
+        """
+        Запустить получение эмбеддинга в фоне, параллельно с генерацией
+        
+        Returns:
+            Задача эмбеддинга или None, если семантический кэш выключен
+        """
+        if not self.settings.ideas_semantic_cache:
+            return None
+        return asyncio.create_task(self._embed_request(goal, format_type))
+    
+    async def _get_cached_ideas(self, niche: str, embedding_task: Optional[asyncio.Task]) -> Optional[List[Dict]]:
+        """
+        Идеи из кэша для той же ниши и похожих цели и формата
+        
+        Эмбеддинг ожидается, только если для ниши уже есть идеи в кэше -
+        иначе сравнивать не с чем и генерация начинается сразу.
+        
+        Returns:
+            Копия идей в случайном порядке или None
+        """
+        if embedding_task is None:
+            return None
+        
+        niche_cache = self._semantic_caches.get(self._niche_key(niche))
+        if not niche_cache:
+            return None
+        
+        embedding = await embedding_task
+        if embedding is None:
+            return None
+        
+        cached = niche_cache.get(embedding)
+        return self._shuffled_copy(cached) if cached is not None else None
+    
+    async def _store_ideas(self, niche: str, embedding_task: Optional[asyncio.Task], ideas: List[Dict]) -> None:
+        """Сохранить идеи в кэш ниши (эмбеддинг к этому моменту обычно уже готов)"""
+        if embedding_task is None:
+            return
+        
+        embedding = await embedding_task
+        if embedding is None:
+            return
+        
+        key = self._niche_key(niche)
+        niche_cache = self._semantic_caches.get(key)
+        if niche_cache is None:
+            niche_cache = SemanticCache(
+                maxsize=_MAX_CACHED_REQUESTS_PER_NICHE,
+                threshold=self.settings.ideas_cache_similarity
+            )
+            self._semantic_caches.set(key, niche_cache)
+        niche_cache.set(embedding, copy.deepcopy(ideas))
+    
+    @staticmethod
+    def _shuffled_copy(ideas: List[Dict]) -> List[Dict]:
+        """Копия идей из кэша в случайном порядке с новой нумерацией"""
+        ideas = copy.deepcopy(ideas)
+        random.shuffle(ideas)
+        for number, idea in enumerate(ideas, 1):
+            idea["id"] = number
+        return ideas
+    
+    @staticmethod
+    def _parse_ideas(response: str) -> List[Dict]:
+        """
+        Разобрать и проверить ответ AI с идеями
+        
+        Args:
+            response: JSON ответ модели
+            
+        Returns:
+            Список из 5 проверенных идей
+            
+        Raises:
+            GenerationError: При неверном формате ответа
+        """
+        # Разбор JSON и проверка структуры за один проход (pydantic-core)
+        try:
+            result = _IDEAS_RESPONSE_ADAPTER.validate_json(response)
+        except ValidationError as e:
+            logger.error(f"Ответ с идеями не соответствует формату: {response[:200]}...")
+            raise GenerationError(
+                f"Ошибка разбора ответа при генерации идей: {e.errors()[0]['msg']}",
+                original_error=e
+            )
+        
+        ideas = result["ideas"]
+        
+        if len(ideas) != 5:
+            logger.warning(f"Получено {len(ideas)} идей вместо 5")
+            if len(ideas) < 5:
+                raise GenerationError(f"Недостаточно идей: получено {len(ideas)}, ожидалось 5")
+        
+        ideas = ideas[:5]  # Берем только первые 5 идей
+        
+        for i, idea in enumerate(ideas, 1):
+            if not isinstance(idea["id"], int):
+                idea["id"] = i  # Исправляем ID если неверный
+        
+        return ideas
     
     async def generate_ideas(
         self,
         niche: str,
         goal: str,
-        format_type: str
+        format_type: str,
+        use_cache: bool = True
     ) -> List[Dict]:
         """
         Сгенерировать 5 идей для контента
         
+        Для той же ниши с похожими по смыслу целью и форматом возвращает ранее
+        сгенерированные идеи (в другом порядке) без запроса к AI.
+        
         Args:
             niche: Ниша пользователя
             goal: Цель контента
             format_type: Формат контента
+            use_cache: Брать идеи из кэша (False - всегда генерировать новые)
             
         Returns:
             Список из 5 идей, каждая в формате:
@@ -60,7 +231,15 @@ class IdeaGenerator:
         Raises:
             GenerationError: При ошибках генерации
         """
+        embedding_task = self._start_embedding(goal, format_type)
+        
         try:
+            if use_cache:
+                cached = await self._get_cached_ideas(niche, embedding_task)
+                if cached is not None:
+                    logger.info(f"Идеи из семантического кэша | Ниша: {niche} | Цель: {goal} | Формат: {format_type}")
+                    return cached
+            
             logger.info(f"Генерация идей | Ниша: {niche} | Цель: {goal} | Формат: {format_type}")
             
             # Построение промпта
@@ -81,48 +260,12 @@ class IdeaGenerator:
                 json_mode=True
             )
             
-            # Парсинг JSON
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError as e:
-                logger.error(f"Не удалось распарсить JSON ответ: {response[:200]}...")
-                raise GenerationError(
-                    "Ошибка парсинга ответа при генерации идей",
-                    original_error=e
-                )
-            
-            # Валидация структуры
-            if "ideas" not in result:
-                raise GenerationError("Отсутствует поле 'ideas' в ответе")
-            
-            ideas = result["ideas"]
-            
-            if not isinstance(ideas, list):
-                raise GenerationError("Поле 'ideas' должно быть списком")
-            
-            if len(ideas) != 5:
-                logger.warning(f"Получено {len(ideas)} идей вместо 5")
-                if len(ideas) < 5:
-                    raise GenerationError(f"Недостаточно идей: получено {len(ideas)}, ожидалось 5")
-            
-            # Валидация каждой идеи
-            required_fields = ["id", "title", "description", "key_elements"]
-            for i, idea in enumerate(ideas[:5], 1):  # Берем только первые 5
-                for field in required_fields:
-                    if field not in idea:
-                        raise GenerationError(f"Отсутствует поле '{field}' в идее {i}")
-                
-                # Проверка типов
-                if not isinstance(idea["id"], int):
-                    idea["id"] = i  # Исправляем ID если неверный
-                
-                if not isinstance(idea["key_elements"], list):
-                    raise GenerationError(f"Поле 'key_elements' в идее {i} должно быть списком")
-            
-            ideas = ideas[:5]  # Обрезаем до 5 идей
+            ideas = self._parse_ideas(response)
             
             logger.info(f"✓ Успешно сгенерировано {len(ideas)} идей")
             
+            await self._store_ideas(niche, embedding_task, ideas)
+            
             return ideas
             
         except GenerationError:
@@ -133,25 +276,152 @@ class IdeaGenerator:
                 f"Не удалось сгенерировать идеи: {str(e)}",
                 original_error=e
             )
+        finally:
+            # При ошибке эмбеддинг уже не нужен (после сохранения задача завершена)
+            if embedding_task is not None:
+                embedding_task.cancel()
     
-    def validate_idea(self, idea: Dict) -> bool:
+    def _extract_complete_ideas(self, partial_response: str) -> List[Dict]:
         """
-        Валидация структуры идеи
+        Достать полностью полученные идеи из незавершенного JSON ответа
         
         Args:
-            idea: Идея для валидации
+            partial_response: Начало JSON ответа модели
             
         Returns:
-            True если идея валидна
+            Идеи, объекты которых уже получены целиком и прошли проверку
+        """
+        match = _IDEAS_ARRAY_RE.search(partial_response)
+        if match is None:
+            return []
+        
+        ideas = []
+        pos = match.end()
+        while True:
+            # Пропускаем разделители между объектами массива
+            while pos < len(partial_response) and partial_response[pos] in " \t\r\n,":
+                pos += 1
+            if pos >= len(partial_response) or partial_response[pos] != "{":
+                break
+            
+            try:
+                idea, pos = _JSON_DECODER.raw_decode(partial_response, pos)
+            except json.JSONDecodeError:
+                break  # Объект получен не полностью
+            
+            if isinstance(idea, dict) and self.validate_idea(idea):
+                ideas.append(idea)
+        
+        return ideas[:5]
+    
+    async def stream_ideas(
+        self,
+        niche: str,
+        goal: str,
+        format_type: str,
+        use_cache: bool = True
+    ) -> AsyncIterator[List[Dict]]:
         """
-        required_fields = ["id", "title", "description", "key_elements"]
+        Сгенерировать 5 идей, отдавая их по мере готовности
+        
+        Ответ модели читается потоком: каждая идея доступна, как только
+        ее JSON объект получен целиком, не дожидаясь остальных.
+        
+        Args:
+            niche: Ниша пользователя
+            goal: Цель контента
+            format_type: Формат контента
+            use_cache: Брать идеи из кэша (False - всегда генерировать новые)
+            
+        Yields:
+            Список уже готовых идей. Последний список - итоговый и проверенный
+            (формат идей - см. generate_ideas)
+            
+        Raises:
+            GenerationError: При ошибках генерации
+        """
+        embedding_task = self._start_embedding(goal, format_type)
+        try:
+            async for ideas in self._stream_ideas(niche, goal, format_type, use_cache, embedding_task):
+                yield ideas
+        finally:
+            # При ошибке или прерванном чтении эмбеддинг уже не нужен
+            if embedding_task is not None:
+                embedding_task.cancel()
+    
+    async def _stream_ideas(
+        self,
+        niche: str,
+        goal: str,
+        format_type: str,
+        use_cache: bool,
+        embedding_task: Optional[asyncio.Task]
+    ) -> AsyncIterator[List[Dict]]:
+        """Тело stream_ideas (параметры и результат - см. stream_ideas)"""
+        if use_cache:
+            cached = await self._get_cached_ideas(niche, embedding_task)
+            if cached is not None:
+                logger.info(f"Идеи из семантического кэша | Ниша: {niche} | Цель: {goal} | Формат: {format_type}")
+                yield cached
+                return
         
-        for field in required_fields:
-            if field not in idea:
-                return False
+        logger.info(f"Потоковая генерация идей | Ниша: {niche} | Цель: {goal} | Формат: {format_type}")
         
-        if not isinstance(idea["key_elements"], list):
-            return False
+        prompt = PromptBuilder.build_ideas_prompt(
+            niche=niche,
+            goal=goal,
+            format_type=format_type
+        )
+        messages = PromptBuilder.build_messages("creator", prompt)
         
-        return True
+        chunks = []
+        ready_count = 0
+        try:
+            async for delta in self.api_client.chat_completion_stream(
+                messages=messages,
+                model=self.settings.model_text_generation,
+                temperature=self.settings.temperature_ideas,
+                max_tokens=self.settings.max_tokens_ideas,
+                json_mode=True
+            ):
+                chunks.append(delta)
+                
+                # Новая идея может завершиться только на закрывающей скобке
+                if "}" not in delta:
+                    continue
+                
+                ready = self._extract_complete_ideas("".join(chunks))
+                if len(ready) > ready_count:
+                    ready_count = len(ready)
+                    yield ready
+            
+            ideas = self._parse_ideas("".join(chunks))
+            
+        except GenerationError:
+            raise
+        except Exception as e:
+            log_exception(logger, e, "Ошибка потоковой генерации идей")
+            raise GenerationError(
+                f"Не удалось сгенерировать идеи: {str(e)}",
+                original_error=e
+            )
+        
+        logger.info(f"✓ Успешно сгенерировано {len(ideas)} идей")
+        
+        await self._store_ideas(niche, embedding_task, ideas)
+        
+        yield ideas
+    
+    @staticmethod
+    def validate_idea(idea: Dict) -> bool:
+        """
+        Валидация структуры идеи
+        
+        Args:
+            idea: Идея для валидации
+            
+        Returns:
+            True если идея валидна
+        """
+        return _REQUIRED_IDEA_FIELDS <= idea.keys() and isinstance(idea["key_elements"], list)
 
@@ -4,9 +4,15 @@
 Отслеживает отклонения от темы и помогает вернуть пользователя к цели диалога.
 """
 
-import json
-from typing import Dict, Optional
+import asyncio
+import hashlib
+import re
+from typing import Dict, List, Optional, Sequence
 
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import TypedDict
+
+from core.cache import LRUCache, SemanticCache
 from core.logger import get_logger, log_exception
 from core.exceptions import ModerationError
 from api.proxyapi_client import ProxyAPIClient
@@ -15,6 +21,167 @@ from config.settings import Settings
 
 logger = get_logger(__name__)
 
+# Список базовых паттернов ненормативной лексики
+# В production стоит использовать более продвинутые методы
+_OFFENSIVE_PATTERNS = (
+    "блять", "бля", "хуй", "пизд", "ебать", "еба", "сука",
+    "пидор", "мудак", "долбоеб", "уебок"
+)
+
+# Все паттерны собраны в одно регулярное выражение, которое компилируется
+# один раз при импорте: один проход по тексту вместо проверки каждого паттерна.
+# Регистр игнорирует само выражение, поэтому копия текста через lower() не нужна.
+# Паттерны - основы слов, поэтому ищутся только в начале слова: иначе
+# срабатывают обычные слова ("хлеба" содержит "еба", "рублям" - "бля")
+_OFFENSIVE_RE = re.compile(
+    r"\b(?:" + "|".join(map(re.escape, _OFFENSIVE_PATTERNS)) + ")",
+    re.IGNORECASE
+)
+
+# Короткие ответы (до N слов) считаются релевантными без запроса к AI
+_SHORT_ANSWER_MAX_WORDS = 3
+
+# Минимальная длина слова, чтобы считать его ключевым словом контекста
+_MIN_KEYWORD_LENGTH = 4
+
+# Сообщения для возврата к теме по номеру попытки: каждое следующее строже,
+# последнее (четвертая попытка и далее) - прощание
+_REDIRECTION_TEMPLATES = (
+    # Первая попытка - мягко
+    "Давай сосредоточимся на создании твоего контента 😊\n\n{bot_question}",
+    # Вторая попытка - настойчивее
+    "Я понимаю, что тебе интересно, но я создан специально для генерации идей контента 🎯\n\n"
+    "Пожалуйста, давай вернемся к нашей задаче.\n\n{bot_question}",
+    # Третья попытка - предупреждение
+    "Я вижу, что тебя что-то отвлекает 😔\n\n"
+    "Мне важно помочь тебе создать качественный контент, "
+    "но для этого мне нужна информация.\n\n"
+    "Если сейчас не подходящее время, мы можем продолжить позже.\n\n"
+    "Готов ответить на мой вопрос?\n\n{bot_question}",
+    # Четвертая и далее - прощание
+    "Понимаю, что сейчас ты не готов работать над контентом 😌\n\n"
+    "Возвращайся, когда будешь готов! Отправь /start для начала новой сессии.\n\n"
+    "Всего хорошего! 👋",
+)
+
+
+class _ModerationResultSchema(TypedDict):
+    """Ответ модели модерации (suggestion пустой или null, если ответ релевантен)"""
+    is_relevant: bool
+    reason: str
+    suggestion: Optional[str]
+
+
+# Разбор и проверка ответа одним вызовом; результат - обычный dict
+_MODERATION_RESULT_ADAPTER = TypeAdapter(_ModerationResultSchema)
+
+# Лимит токенов ответа модерации: флаг и две короткие фразы на русском
+# укладываются примерно в 80 токенов, запас - чтобы JSON не обрезался
+_MODERATION_MAX_TOKENS = 120
+
+# Сколько символов ответа модели писать в лог при ошибке разбора
+_MAX_LOGGED_RESPONSE = 512
+
+# Ответы, привязанные ко времени, не кэшируются: их оценка зависит от момента
+_NO_CACHE_RE = re.compile(r"сегодня|завтра|вчера|сейчас|который час|погод", re.IGNORECASE)
+
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+class ModerationCache:
+    """
+    Двухуровневый кэш результатов проверки релевантности
+    
+    - точное совпадение: SHA-256 от этапа, вопроса и нормализованного ответа;
+    - похожие по смыслу ответы на тот же вопрос: близость эмбеддингов.
+    
+    Не потокобезопасен - рассчитан на использование внутри одного event loop.
+    """
+    
+    def __init__(self, threshold: float = 0.95, maxsize: int = 2048, ttl: float = 24 * 3600):
+        """
+        Args:
+            threshold: Минимальная косинусная близость ответов для попадания в кэш
+            maxsize: Максимальное количество точных записей
+            ttl: Время жизни записей семантического уровня в секундах
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self._exact = LRUCache(maxsize=maxsize)
+        # Отдельный семантический кэш на каждую пару (этап, вопрос):
+        # похожий ответ на другой вопрос может иметь другую оценку
+        self._semantic = LRUCache(maxsize=64)
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Нормализация ответа: регистр, пробелы и знаки препинания по краям"""
+        return _WHITESPACE_RE.sub(" ", text.lower()).strip(" .,!?;:")
+    
+    @classmethod
+    def make_key(cls, current_step: str, bot_question: str, user_response: str) -> str:
+        """Ключ точного совпадения"""
+        raw = f"{current_step}|{bot_question}|{cls.normalize(user_response)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+    
+    @staticmethod
+    def is_cacheable(user_response: str) -> bool:
+        """Можно ли кэшировать оценку ответа"""
+        return _NO_CACHE_RE.search(user_response) is None
+    
+    def get_exact(self, key: str) -> Optional[Dict]:
+        """Результат для точно такого же ответа или None"""
+        return self._exact.get(key)
+    
+    def get_similar(
+        self,
+        current_step: str,
+        bot_question: str,
+        embedding: Sequence[float]
+    ) -> Optional[Dict]:
+        """Результат для похожего ответа на тот же вопрос или None"""
+        semantic = self._semantic.get((current_step, bot_question))
+        if semantic is None:
+            return None
+        return semantic.get(embedding)
+    
+    def store(
+        self,
+        key: str,
+        current_step: str,
+        bot_question: str,
+        embedding: Optional[Sequence[float]],
+        result: Dict
+    ) -> None:
+        """
+        Сохранить результат проверки
+        
+        Args:
+            key: Ключ точного совпадения (make_key)
+            current_step: Этап диалога
+            bot_question: Вопрос бота
+            embedding: Эмбеддинг ответа (None - только точный уровень)
+            result: Результат проверки
+        """
+        self._exact.set(key, result)
+        
+        if embedding is not None:
+            self.store_similar(current_step, bot_question, embedding, result)
+    
+    def store_similar(
+        self,
+        current_step: str,
+        bot_question: str,
+        embedding: Sequence[float],
+        result: Dict
+    ) -> None:
+        """Сохранить результат только в семантический уровень"""
+        scope = (current_step, bot_question)
+        semantic = self._semantic.get(scope)
+        if semantic is None:
+            semantic = SemanticCache(threshold=self.threshold, ttl=self.ttl)
+            self._semantic.set(scope, semantic)
+        semantic.set(embedding, result)
+
 
 class ModerationService:
     """
@@ -33,6 +200,66 @@ class ModerationService:
         """
         self.api_client = api_client
         self.settings = settings
+        
+        # Результаты проверок для совпадающих и похожих ответов
+        self._cache = ModerationCache(threshold=settings.moderation_cache_similarity)
+    
+    async def _embed_response(self, user_response: str) -> Optional[List[float]]:
+        """
+        Эмбеддинг ответа для семантического уровня кэша
+        
+        Returns:
+            Вектор или None, если эмбеддинг получить не удалось
+        """
+        try:
+            return await self.api_client.create_embedding(
+                user_response,
+                model=self.settings.model_embeddings
+            )
+        except Exception as e:
+            logger.warning("Семантический кэш модерации недоступен: %s", e)
+            return None
+    
+    async def _request_moderation(
+        self,
+        current_step: str,
+        bot_question: str,
+        user_response: str
+    ) -> Dict[str, any]:
+        """
+        Проверка релевантности моделью (без кэша)
+        
+        Raises:
+            ModerationError: Если ответ модели не соответствует формату
+        """
+        # Построение промпта
+        prompt = PromptBuilder.build_moderation_prompt(
+            current_step=current_step,
+            bot_question=bot_question,
+            user_response=user_response
+        )
+        
+        messages = PromptBuilder.build_messages("moderator", prompt)
+        
+        # Запрос к API
+        response = await self.api_client.chat_completion(
+            messages=messages,
+            model=self.settings.model_moderation,
+            temperature=self.settings.temperature_moderation,
+            max_tokens=_MODERATION_MAX_TOKENS,
+            json_mode=True
+        )
+        
+        # Разбор JSON и проверка структуры за один проход (pydantic-core)
+        try:
+            return _MODERATION_RESULT_ADAPTER.validate_json(response)
+        except ValidationError as e:
+            # Ответ модели может быть длинным - в лог попадает только начало
+            logger.error("Ответ модерации не соответствует формату: %s", response[:_MAX_LOGGED_RESPONSE])
+            raise ModerationError(
+                f"Ошибка разбора ответа модерации: {e.errors()[0]['msg']}",
+                original_error=e
+            )
     
     async def check_relevance(
         self,
@@ -43,6 +270,10 @@ class ModerationService:
         """
         Проверить релевантность ответа пользователя
         
+        Эмбеддинг для семантического уровня кэша запрашивается параллельно
+        с моделью и не увеличивает время проверки: похожий ответ из кэша
+        используется, только если эмбеддинг готов раньше ответа модели.
+        
         Args:
             current_step: Текущий этап диалога
             bot_question: Вопрос бота
@@ -57,45 +288,58 @@ class ModerationService:
         Raises:
             ModerationError: При ошибках модерации
         """
+        moderation_task = embedding_task = None
         try:
-            logger.info(f"Проверка релевантности | Этап: {current_step} | Длина ответа: {len(user_response)}")
+            logger.info("Проверка релевантности | Этап: %s | Длина ответа: %d", current_step, len(user_response))
             
-            # Построение промпта
-            prompt = PromptBuilder.build_moderation_prompt(
-                current_step=current_step,
-                bot_question=bot_question,
-                user_response=user_response
-            )
+            use_cache = self.settings.moderation_cache and self._cache.is_cacheable(user_response)
+            cache_key = None
             
-            messages = PromptBuilder.build_messages("moderator", prompt)
+            if use_cache:
+                cache_key = ModerationCache.make_key(current_step, bot_question, user_response)
+                cached = self._cache.get_exact(cache_key)
+                if cached is not None:
+                    logger.info(
+                        "Результат модерации из кэша: %s",
+                        "Релевантно" if cached["is_relevant"] else "Нерелевантно"
+                    )
+                    return dict(cached)
             
-            # Запрос к API
-            response = await self.api_client.chat_completion(
-                messages=messages,
-                model=self.settings.model_text_generation,
-                temperature=self.settings.temperature_moderation,
-                max_tokens=200,
-                json_mode=True
+            moderation_task = asyncio.create_task(
+                self._request_moderation(current_step, bot_question, user_response)
             )
             
-            # Парсинг JSON
-            try:
-                result = json.loads(response)
-            except json.JSONDecodeError as e:
-                logger.error(f"Не удалось распарсить JSON ответ модерации: {response}")
-                raise ModerationError(
-                    "Ошибка парсинга ответа модерации",
-                    original_error=e
-                )
+            if use_cache:
+                embedding_task = asyncio.create_task(self._embed_response(user_response))
+                await asyncio.wait({moderation_task, embedding_task}, return_when=asyncio.FIRST_COMPLETED)
+                
+                if not moderation_task.done() and embedding_task.done() and embedding_task.result() is not None:
+                    cached = self._cache.get_similar(current_step, bot_question, embedding_task.result())
+                    if cached is not None:
+                        moderation_task.cancel()
+                        logger.info(
+                            "Результат модерации из кэша (похожий ответ): %s",
+                            "Релевантно" if cached["is_relevant"] else "Нерелевантно"
+                        )
+                        return dict(cached)
             
-            # Валидация структуры
-            required_fields = ["is_relevant", "reason", "suggestion"]
-            for field in required_fields:
-                if field not in result:
-                    raise ModerationError(f"Отсутствует поле '{field}' в ответе модерации")
+            result = await moderation_task
             
             is_relevant = result["is_relevant"]
-            logger.info(f"Результат модерации: {'Релевантно' if is_relevant else 'Нерелевантно'} | {result['reason']}")
+            logger.info(
+                "Результат модерации: %s | %s",
+                "Релевантно" if is_relevant else "Нерелевантно",
+                result["reason"]
+            )
+            
+            if use_cache:
+                self._cache.store(cache_key, current_step, bot_question, None, dict(result))
+                # Семантический уровень пополняется, когда эмбеддинг будет готов -
+                # ответ пользователю его не ждет
+                embedding_task.add_done_callback(
+                    lambda task: self._store_similar(task, current_step, bot_question, dict(result))
+                )
+                embedding_task = None
             
             return result
             
@@ -107,6 +351,23 @@ class ModerationService:
                 f"Не удалось проверить релевантность: {str(e)}",
                 original_error=e
             )
+        finally:
+            # При ошибке или отмене фоновые запросы больше не нужны
+            for task in (moderation_task, embedding_task):
+                if task is not None:
+                    task.cancel()
+    
+    def _store_similar(
+        self,
+        embedding_task: asyncio.Task,
+        current_step: str,
+        bot_question: str,
+        result: Dict
+    ) -> None:
+        """Сохранить результат в семантический уровень кэша по готовому эмбеддингу"""
+        if embedding_task.cancelled() or embedding_task.result() is None:
+            return
+        self._cache.store_similar(current_step, bot_question, embedding_task.result(), result)
     
     def get_redirection_message(
         self,
@@ -127,36 +388,14 @@ class ModerationService:
         Returns:
             Текст сообщения для пользователя
         """
-        if attempt_number == 1:
-            # Первая попытка - мягко
-            if suggestion:
-                return suggestion
-            return f"Давай сосредоточимся на создании твоего контента 😊\n\n{bot_question}"
-        
-        elif attempt_number == 2:
-            # Вторая попытка - настойчивее
-            return (
-                f"Я понимаю, что тебе интересно, но я создан специально для генерации идей контента 🎯\n\n"
-                f"Пожалуйста, давай вернемся к нашей задаче.\n\n{bot_question}"
-            )
+        last = len(_REDIRECTION_TEMPLATES) - 1
+        index = attempt_number - 1 if 0 < attempt_number <= last else last
         
-        elif attempt_number == 3:
-            # Третья попытка - предупреждение
-            return (
-                f"Я вижу, что тебя что-то отвлекает 😔\n\n"
-                f"Мне важно помочь тебе создать качественный контент, "
-                f"но для этого мне нужна информация.\n\n"
-                f"Если сейчас не подходящее время, мы можем продолжить позже.\n\n"
-                f"Готов ответить на мой вопрос?\n\n{bot_question}"
-            )
+        # Первая попытка - мягко: подходит и предложение от AI
+        if index == 0 and suggestion:
+            return suggestion
         
-        else:
-            # Четвертая и далее - прощание
-            return (
-                "Понимаю, что сейчас ты не готов работать над контентом 😌\n\n"
-                "Возвращайся, когда будешь готов! Отправь /start для начала новой сессии.\n\n"
-                "Всего хорошего! 👋"
-            )
+        return _REDIRECTION_TEMPLATES[index].format(bot_question=bot_question)
     
     def should_end_conversation(self, attempt_number: int) -> bool:
         """
@@ -170,6 +409,38 @@ class ModerationService:
         """
         return attempt_number > self.settings.max_off_topic_attempts
     
+    def is_obviously_relevant(self, user_response: str, context_texts: List[str]) -> bool:
+        """
+        Быстрая локальная проверка релевантности без запроса к AI
+        
+        Считает ответ релевантным, если:
+        - это короткий ответ (до _SHORT_ANSWER_MAX_WORDS слов) - типичный ответ на вопрос
+          о нише, цели или формате ("фитнес", "продажи курса");
+        - ответ содержит ключевое слово из уже собранных данных (ниша, цель).
+        
+        Проверка на ненормативную лексику должна выполняться до вызова.
+        
+        Args:
+            user_response: Ответ пользователя
+            context_texts: Уже собранные ответы пользователя (ниша, цель)
+            
+        Returns:
+            True если AI-проверку можно пропустить
+        """
+        words = user_response.lower().split()
+        
+        if len(words) <= _SHORT_ANSWER_MAX_WORDS:
+            return True
+        
+        keywords = {
+            word
+            for text in context_texts if text
+            for word in text.lower().split()
+            if len(word) >= _MIN_KEYWORD_LENGTH
+        }
+        
+        return any(word in keywords for word in words)
+    
     def detect_offensive_content(self, text: str) -> bool:
         """
         Простая проверка на ненормативную лексику
@@ -182,13 +453,5 @@ class ModerationService:
         Returns:
             True если обнаружен мат, False иначе
         """
-        # Список базовых паттернов ненормативной лексики
-        # В production стоит использовать более продвинутые методы
-        offensive_patterns = [
-            "блять", "бля", "хуй", "пизд", "ебать", "еба", "сука", 
-            "пидор", "мудак", "долбоеб", "уебок"
-        ]
-        
-        text_lower = text.lower()
-        return any(pattern in text_lower for pattern in offensive_patterns)
+        return _OFFENSIVE_RE.search(text) is not None
 
@@ -4,12 +4,20 @@
 Создает готовые посты с изображениями на основе выбранной идеи.
 """
 
-import json
-from typing import Dict, Tuple, Optional
+import os
+import re
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Dict, List, Tuple, Optional, Sequence
 from pathlib import Path
 import time
 
+from pydantic import TypeAdapter, ValidationError
+from typing_extensions import NotRequired, TypedDict
+
+from core.cache import LRUCache, SemanticCache
 from core.logger import get_logger, log_exception
+from core.json_utils import json_loads, JSONDecodeError
 from core.exceptions import GenerationError, ImageGenerationError
 from api.proxyapi_client import ProxyAPIClient
 from prompts.builders import PromptBuilder
@@ -17,6 +25,169 @@ from config.settings import Settings
 
 logger = get_logger(__name__)
 
+# Ошибки основной модели, после которых стоит попробовать fallback модель:
+# пустой контент, отказ или исчерпанный лимит токенов
+_FALLBACK_TRIGGERS_RE = re.compile(r"пустой контент|отказала|finish_reason:\s*length", re.IGNORECASE)
+
+
+class _PostSchema(TypedDict):
+    """Пост в ответе модели (хештеги и призыв к действию необязательны)"""
+    title: str
+    content: str
+    hashtags: NotRequired[Optional[List[Any]]]
+    call_to_action: NotRequired[Optional[str]]
+
+
+class _PostResponseSchema(TypedDict):
+    """Ответ модели с постом: {"post": {...}}"""
+    post: _PostSchema
+
+
+# Разбор и проверка ответа одним вызовом; результат - обычные dict
+_POST_RESPONSE_ADAPTER = TypeAdapter(_PostResponseSchema)
+
+# Разделитель заголовков этапов генерации в логе
+_BANNER_LINE = "=" * 80
+
+# Подпапка images_folder для кэша изображений
+_IMAGE_CACHE_DIR = "_cache"
+
+# Ограничения кэша изображений: файлов на диске (при сохранении изображений)
+# и изображений в памяти (если сохранение выключено - каждое весит 1-3 МБ)
+_IMAGE_CACHE_MAX_FILES = 500
+_IMAGE_CACHE_MAX_IN_MEMORY = 32
+
+# Время жизни записей кэша изображений (и файлов на диске) в секундах
+_IMAGE_CACHE_TTL = 7 * 24 * 3600
+
+
+class ImageCache:
+    """
+    Кэш сгенерированных изображений по промпту
+    
+    Точное совпадение ищется по SHA-256 нормализованного промпта, похожие
+    промпты - по близости эмбеддингов. Если задана папка (сохранение изображений
+    включено), изображения хранятся файлами и точные совпадения переживают
+    перезапуск бота; старые файлы удаляются по возрасту и количеству.
+    Без папки изображения хранятся только в памяти, в ограниченном количестве.
+    Не потокобезопасен - рассчитан на использование внутри одного event loop.
+    """
+    
+    def __init__(
+        self,
+        folder: Optional[Path],
+        threshold: float = 0.97,
+        max_files: int = _IMAGE_CACHE_MAX_FILES,
+        max_in_memory: int = _IMAGE_CACHE_MAX_IN_MEMORY,
+        ttl: float = _IMAGE_CACHE_TTL
+    ):
+        """
+        Args:
+            folder: Папка для файлов кэша (None - кэш только в памяти)
+            threshold: Минимальная косинусная близость промптов для попадания в кэш
+            max_files: Максимальное количество файлов в папке кэша
+            max_in_memory: Максимальное количество изображений в памяти (без папки)
+            ttl: Время жизни записей в секундах
+        """
+        self.folder = folder
+        self.max_files = max_files
+        self.ttl = ttl
+        
+        maxsize = max_files if folder is not None else max_in_memory
+        self._semantic = SemanticCache(maxsize=maxsize, threshold=threshold, ttl=ttl)
+        # Без папки: ключ -> (URL, байты); с папкой: ключ -> URL (байты в файле)
+        self._entries = LRUCache(maxsize=maxsize)
+    
+    @staticmethod
+    def make_key(image_prompt: str) -> str:
+        """Ключ точного совпадения: SHA-256 нормализованного промпта"""
+        return hashlib.sha256(" ".join(image_prompt.lower().split()).encode()).hexdigest()
+    
+    def _path(self, key: str) -> Path:
+        return self.folder / f"{key}.png"
+    
+    async def get(self, key: str) -> Optional[Tuple[str, bytes]]:
+        """
+        Найти изображение по ключу
+        
+        Returns:
+            Кортеж (URL изображения, байты изображения) или None
+        """
+        if self.folder is None:
+            return self._entries.get(key)
+        
+        path = self._path(key)
+        try:
+            image_bytes = await asyncio.to_thread(path.read_bytes)
+        except OSError:
+            return None
+        return self._entries.get(key) or path.absolute().as_uri(), image_bytes
+    
+    async def get_similar(self, embedding: Sequence[float]) -> Optional[Tuple[str, bytes]]:
+        """
+        Найти изображение для самого похожего промпта
+        
+        Returns:
+            Кортеж (URL изображения, байты изображения) или None
+        """
+        key = self._semantic.get(embedding)
+        if key is None:
+            return None
+        return await self.get(key)
+    
+    def _write(self, path: Path, image_bytes: bytes) -> None:
+        """Записать файл и удалить устаревшие и лишние (выполняется в отдельном потоке)"""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Запись во временный файл и переименование: читатель не увидит недописанный файл
+        tmp_path = path.with_suffix(".tmp")
+        tmp_path.write_bytes(image_bytes)
+        os.replace(tmp_path, path)
+        
+        files = []
+        expired_before = time.time() - self.ttl
+        for file in path.parent.glob("*.png"):
+            try:
+                mtime = file.stat().st_mtime
+                if mtime < expired_before:
+                    file.unlink()
+                else:
+                    files.append((mtime, file))
+            except OSError:
+                continue
+        
+        # Сверх лимита удаляются самые старые файлы
+        files.sort()
+        for _, file in files[:max(0, len(files) - self.max_files)]:
+            try:
+                file.unlink()
+            except OSError:
+                continue
+    
+    async def store(
+        self,
+        key: str,
+        embedding: Optional[Sequence[float]],
+        image_url: str,
+        image_bytes: bytes
+    ) -> None:
+        """
+        Сохранить изображение в кэш
+        
+        Args:
+            key: Ключ точного совпадения (make_key)
+            embedding: Эмбеддинг промпта (None - только точный уровень)
+            image_url: URL изображения
+            image_bytes: Байты изображения
+        """
+        if self.folder is None:
+            self._entries.set(key, (image_url, image_bytes))
+        else:
+            await asyncio.to_thread(self._write, self._path(key), image_bytes)
+            self._entries.set(key, image_url)
+        
+        if embedding is not None:
+            self._semantic.set(embedding, key)
+
 
 class PostGenerator:
     """
@@ -38,6 +209,29 @@ class PostGenerator:
         """
         self.api_client = api_client
         self.settings = settings
+        
+        # Изображения для совпадающих и похожих промптов: на диске - только если
+        # сохранение изображений включено, иначе в памяти
+        self._image_cache = ImageCache(
+            Path(settings.images_folder) / _IMAGE_CACHE_DIR if settings.save_images_locally else None,
+            threshold=settings.image_cache_similarity
+        )
+    
+    async def _embed_image_prompt(self, image_prompt: str) -> Optional[List[float]]:
+        """
+        Эмбеддинг промпта для семантического кэша изображений
+        
+        Returns:
+            Вектор или None, если эмбеддинг получить не удалось
+        """
+        try:
+            return await self.api_client.create_embedding(
+                image_prompt,
+                model=self.settings.model_embeddings
+            )
+        except Exception as e:
+            logger.warning("Семантический кэш изображений недоступен: %s", e)
+            return None
     
     async def generate_post_text(
         self,
@@ -68,7 +262,7 @@ class PostGenerator:
             GenerationError: При ошибках генерации
         """
         try:
-            logger.info(f"Генерация текста поста | Идея: {idea.get('title', 'N/A')}")
+            logger.info("Генерация текста поста | Идея: %s", idea.get("title", "N/A"))
             
             # Построение промпта
             prompt = PromptBuilder.build_post_prompt(
@@ -94,13 +288,11 @@ class PostGenerator:
                 )
             except GenerationError as e:
                 # Если модель вернула пустой контент, отказала или исчерпала токены, пробуем fallback
-                error_str = str(e).lower()
-                if ("пустой контент" in error_str or 
-                    "отказала" in error_str or 
-                    "finish_reason: length" in error_str):
+                if _FALLBACK_TRIGGERS_RE.search(str(e)):
                     logger.warning(
-                        f"Основная модель не справилась ({self.settings.model_final_post}), "
-                        f"переключаемся на fallback (gpt-4o) | Причина: {e}"
+                        "Основная модель не справилась (%s), переключаемся на fallback (gpt-4o) | Причина: %s",
+                        self.settings.model_final_post,
+                        e
                     )
                     response = await self.api_client.chat_completion(
                         messages=messages,
@@ -112,35 +304,23 @@ class PostGenerator:
                 else:
                     raise
             
-            # Парсинг JSON
+            # Разбор JSON и проверка структуры за один проход (pydantic-core)
             try:
-                result = json.loads(response)
-            except json.JSONDecodeError as e:
-                logger.error(f"Не удалось распарсить JSON ответ поста")
+                post_data = _POST_RESPONSE_ADAPTER.validate_json(response)["post"]
+            except ValidationError as e:
+                logger.error("Ответ с постом не соответствует формату")
                 raise GenerationError(
-                    "Ошибка парсинга ответа при генерации поста",
+                    f"Ошибка разбора ответа при генерации поста: {e.errors()[0]['msg']}",
                     original_error=e
                 )
             
-            # Валидация структуры
-            if "post" not in result:
-                raise GenerationError("Отсутствует поле 'post' в ответе")
-            
-            post_data = result["post"]
-            
-            # Обязательные поля
-            required_fields = ["title", "content"]
-            for field in required_fields:
-                if field not in post_data:
-                    raise GenerationError(f"Отсутствует поле '{field}' в данных поста")
-            
             # Необязательные поля с значениями по умолчанию
-            if "hashtags" not in post_data or not post_data["hashtags"]:
+            if not post_data.get("hashtags"):
                 post_data["hashtags"] = []
-            if "call_to_action" not in post_data:
+            if post_data.get("call_to_action") is None:
                 post_data["call_to_action"] = ""
             
-            logger.info(f"✓ Текст поста сгенерирован | Длина: {len(post_data['content'])} символов")
+            logger.info("✓ Текст поста сгенерирован | Длина: %d символов", len(post_data["content"]))
             
             return post_data
             
@@ -197,8 +377,8 @@ class PostGenerator:
             
             # Парсинг JSON
             try:
-                result = json.loads(response)
-            except json.JSONDecodeError as e:
+                result = json_loads(response)
+            except JSONDecodeError as e:
                 logger.error("Не удалось распарсить JSON ответ image prompt")
                 raise GenerationError(
                     "Ошибка парсинга ответа при генерации image prompt",
@@ -216,8 +396,8 @@ class PostGenerator:
             
             full_prompt = image_prompt_data["full_prompt"]
             
-            logger.info(f"✓ Промпт для изображения сгенерирован | Длина: {len(full_prompt)} символов")
-            logger.debug(f"Image prompt: {full_prompt}")
+            logger.info("✓ Промпт для изображения сгенерирован | Длина: %d символов", len(full_prompt))
+            logger.debug("Image prompt: %s", full_prompt)
             
             return full_prompt
             
@@ -238,33 +418,74 @@ class PostGenerator:
             image_prompt: Промпт для DALL-E
             
         Returns:
-            Кортеж (URL изображения, байты изображения или None)
+            Кортеж (URL изображения или пустая строка, если API вернул только
+            байты и файл не сохранялся; байты изображения)
             
         Raises:
             ImageGenerationError: При ошибках генерации
         """
         try:
-            logger.info("Генерация изображения через DALL-E")
-            
-            # Генерация изображения
-            image_url = await self.api_client.generate_image(
-                prompt=image_prompt,
-                model=self.settings.model_image_generation,
-                size="1024x1024",
-                quality="standard"
-            )
-            
-            logger.info(f"✓ Изображение сгенерировано | URL: {image_url[:50]}...")
+            cache_key = embedding_task = None
+            if self.settings.image_cache:
+                cache_key = ImageCache.make_key(image_prompt)
+                cached = await self._image_cache.get(cache_key)
+                if cached is not None:
+                    logger.info("✓ Изображение взято из кэша")
+                    return cached
+                
+                # Эмбеддинг для поиска похожего промпта запрашивается одновременно
+                # с генерацией, а не перед ней
+                embedding_task = asyncio.create_task(self._embed_image_prompt(image_prompt))
             
-            # Скачивание изображения
-            image_bytes = await self.api_client.download_image(image_url)
+            logger.info("Генерация изображения через DALL-E")
             
             # Сохранение локально если нужно
+            save_path = None
             if self.settings.save_images_locally:
                 timestamp = int(time.time())
                 save_path = Path(self.settings.images_folder) / f"post_{timestamp}.png"
-                await self.api_client.download_image(image_url, save_path)
-                logger.info(f"Изображение сохранено локально: {save_path}")
+            
+            # Байты изображения приходят в ответе API - без отдельного скачивания по URL
+            generation_task = asyncio.create_task(self.api_client.generate_image_bytes(
+                prompt=image_prompt,
+                model=self.settings.model_image_generation,
+                size="1024x1024",
+                quality="standard",
+                save_path=save_path
+            ))
+            
+            embedding = None
+            try:
+                if embedding_task is not None:
+                    embedding = await embedding_task
+                    cached = await self._image_cache.get_similar(embedding) if embedding is not None else None
+                    if cached is not None:
+                        # Эмбеддинг готов намного раньше изображения - генерация не нужна
+                        generation_task.cancel()
+                        logger.info("✓ Изображение взято из кэша (похожий промпт)")
+                        return cached
+                
+                image_url, image_bytes = await generation_task
+            except BaseException:
+                generation_task.cancel()
+                if embedding_task is not None:
+                    embedding_task.cancel()
+                raise
+            
+            # Если API не вернул URL, ссылкой служит локальный файл (если сохранен)
+            if not image_url:
+                image_url = save_path.absolute().as_uri() if save_path else ""
+            
+            logger.info("✓ Изображение сгенерировано | %d байт", len(image_bytes))
+            
+            if save_path:
+                logger.info("Изображение сохранено локально: %s", save_path)
+            
+            if cache_key is not None:
+                try:
+                    await self._image_cache.store(cache_key, embedding, image_url, image_bytes)
+                except OSError as e:
+                    logger.warning("Не удалось сохранить изображение в кэш: %s", e)
             
             return image_url, image_bytes
             
@@ -277,12 +498,41 @@ class PostGenerator:
                 original_error=e
             )
     
+    async def _generate_illustration(
+        self,
+        niche: str,
+        format_type: str,
+        post_data: Dict
+    ) -> Tuple[str, bytes]:
+        """
+        Сгенерировать промпт для изображения и само изображение
+        
+        Args:
+            niche: Ниша
+            format_type: Формат
+            post_data: Заголовок и содержание ({"title", "content"}) поста или идеи
+            
+        Returns:
+            Кортеж (URL изображения, байты изображения)
+        """
+        logger.info("Генерация промпта для изображения")
+        image_prompt = await self.generate_image_prompt(
+            niche=niche,
+            format_type=format_type,
+            post_data=post_data
+        )
+        
+        logger.info("Генерация изображения")
+        return await self.generate_image(image_prompt)
+    
     async def generate_complete_post(
         self,
         niche: str,
         goal: str,
         format_type: str,
-        idea: Dict
+        idea: Dict,
+        post_data: Optional[Dict] = None,
+        post_text: Optional[Awaitable[Dict]] = None
     ) -> Tuple[Dict, str, bytes]:
         """
         Сгенерировать полный пост с изображением
@@ -292,11 +542,18 @@ class PostGenerator:
         2. Промпт для изображения
         3. Изображение
         
+        Если текст поста еще не готов, изображение строится по описанию идеи
+        и генерируется параллельно с текстом: общее время равно самому
+        долгому из этапов, а не их сумме.
+        
         Args:
             niche: Ниша
             goal: Цель
             format_type: Формат
             idea: Выбранная идея
+            post_data: Уже сгенерированный текст поста (изображение строится по нему)
+            post_text: Уже запущенная генерация текста (например, заранее в фоне) -
+                используется вместо новой, изображение генерируется параллельно
             
         Returns:
             Кортеж (данные поста, URL изображения, байты изображения)
@@ -304,35 +561,44 @@ class PostGenerator:
         Raises:
             GenerationError, ImageGenerationError: При ошибках генерации
         """
-        logger.info("=" * 80)
-        logger.info("НАЧАЛО ГЕНЕРАЦИИ ПОЛНОГО ПОСТА")
-        logger.info("=" * 80)
+        logger.info("%s\nНАЧАЛО ГЕНЕРАЦИИ ПОЛНОГО ПОСТА\n%s", _BANNER_LINE, _BANNER_LINE)
         
         try:
-            # Этап 1: Генерация текста поста
-            logger.info("Этап 1/3: Генерация текста поста")
-            post_data = await self.generate_post_text(
-                niche=niche,
-                goal=goal,
-                format_type=format_type,
-                idea=idea
-            )
-            
-            # Этап 2: Генерация промпта для изображения
-            logger.info("Этап 2/3: Генерация промпта для изображения")
-            image_prompt = await self.generate_image_prompt(
-                niche=niche,
-                format_type=format_type,
-                post_data=post_data
-            )
-            
-            # Этап 3: Генерация изображения
-            logger.info("Этап 3/3: Генерация изображения")
-            image_url, image_bytes = await self.generate_image(image_prompt)
+            if post_data is not None:
+                logger.info("Текст поста уже сгенерирован заранее, генерируем изображение по нему")
+                image_url, image_bytes = await self._generate_illustration(niche, format_type, post_data)
+            else:
+                logger.info("Параллельная генерация текста поста и изображения по идее")
+                
+                # Для промпта изображения достаточно описания идеи
+                key_elements = ", ".join(idea.get("key_elements", []))
+                idea_summary = {
+                    "title": idea["title"],
+                    "content": f"{idea['description']}\n\nКлючевые элементы: {key_elements}"
+                }
+                
+                if post_text is not None:
+                    text_task = asyncio.ensure_future(post_text)
+                else:
+                    text_task = asyncio.create_task(self.generate_post_text(
+                        niche=niche,
+                        goal=goal,
+                        format_type=format_type,
+                        idea=idea
+                    ))
+                image_task = asyncio.create_task(
+                    self._generate_illustration(niche, format_type, idea_summary)
+                )
+                
+                try:
+                    post_data, (image_url, image_bytes) = await asyncio.gather(text_task, image_task)
+                except BaseException:
+                    # Если один из этапов упал, второй результат уже не нужен
+                    text_task.cancel()
+                    image_task.cancel()
+                    raise
             
-            logger.info("=" * 80)
-            logger.info("✓ ПОЛНЫЙ ПОСТ УСПЕШНО СГЕНЕРИРОВАН")
-            logger.info("=" * 80)
+            logger.info("%s\n✓ ПОЛНЫЙ ПОСТ УСПЕШНО СГЕНЕРИРОВАН\n%s", _BANNER_LINE, _BANNER_LINE)
             
             return post_data, image_url, image_bytes
             